@@ -0,0 +1,58 @@
+# Error of sampling SurvSHAP(t) versus the exact average over all paths (exact=True)
+# for different path generators and numbers of paths B, on the datasets from Experiment 1.
+# Run from the paper/other_codes directory; results are saved to ../results/exp1_path_sampling_benchmark.csv
+import numpy as np
+import pandas as pd
+from sksurv.util import Surv
+from sksurv.linear_model import CoxPHSurvivalAnalysis
+from sksurv.ensemble import RandomSurvivalForest
+from survshap import SurvivalModelExplainer, PredictSurvSHAP
+
+DATASETS = ["exponential", "weibull_td", "non_td", "complex"]
+PATH_SAMPLING = ["random", "antithetic", "stratified"]
+BS = [5, 10, 20, 40, 80, 160]
+N_BACKGROUND = 100
+N_OBSERVATIONS = 5
+N_REPEATS = 5
+
+
+def shap_array(explanation):
+    result = explanation.result[explanation.result["B"] == 0].sort_values("variable_name")
+    return result.iloc[:, 5:].values
+
+
+results = []
+for dataset in DATASETS:
+    data = pd.read_csv(f"../data/exp1_data_{dataset}.csv")
+    X = data.loc[:, ["x1", "x2", "x3", "x4", "x5"]]
+    y = Surv.from_dataframe("event", "time", data)
+    models = {
+        "CPH": CoxPHSurvivalAnalysis().fit(X, y),
+        "RSF": RandomSurvivalForest(
+            random_state=42, n_estimators=100, min_samples_split=8, min_samples_leaf=4, max_features=3, max_samples=0.8
+        ).fit(X, y),
+    }
+    rng = np.random.default_rng(123)
+    background = rng.choice(len(X), N_BACKGROUND, replace=False)
+    observations = rng.choice(np.setdiff1d(np.arange(len(X)), background), N_OBSERVATIONS, replace=False)
+
+    for model_name, model in models.items():
+        explainer = SurvivalModelExplainer(model, X.iloc[background], y[background])
+        timestamps = explainer.select_timestamps(method="quantiles", n_timestamps=50)
+        for i in observations:
+            exact = PredictSurvSHAP(calculation_method="sampling", exact=True)
+            exact.fit(explainer, X.iloc[[i]], timestamps)
+            exact_values = shap_array(exact)
+            for path_sampling in PATH_SAMPLING:
+                for B in BS:
+                    for repeat in range(N_REPEATS):
+                        explanation = PredictSurvSHAP(
+                            calculation_method="sampling", B=B, random_state=repeat, path_sampling=path_sampling
+                        )
+                        explanation.fit(explainer, X.iloc[[i]], timestamps)
+                        error = np.sqrt(np.mean((shap_array(explanation) - exact_values) ** 2))
+                        results.append([dataset, model_name, i, path_sampling, B, repeat, error])
+
+results = pd.DataFrame(results, columns=["dataset", "model", "observation", "path_sampling", "B", "repeat", "rmse"])
+results.to_csv("../results/exp1_path_sampling_benchmark.csv", index=False)
+print(results.groupby(["dataset", "model", "path_sampling", "B"])["rmse"].mean().unstack("B").round(5))
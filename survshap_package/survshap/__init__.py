@@ -1,7 +1,23 @@
 from .predict_explanations.object import PredictSurvSHAP
 from .model_explanations.object import ModelSurvSHAP
+from .model_explanations.monitor import ModelSurvSHAPMonitor
 from .explainer import SurvivalModelExplainer
+from .result import SurvSHAPResult, SurvSHAPStatistics
+from .streaming import SurvSHAPResultStore
+from .evaluators import CoxCoalitionEvaluator, ForestCoalitionEvaluator
+from .session import SurvSHAPSession
 
 __version__ = "0.4.2"
 
-__all__ = ["PredictSurvSHAP", "ModelSurvSHAP", "SurvivalModelExplainer"]
+__all__ = [
+    "PredictSurvSHAP",
+    "ModelSurvSHAP",
+    "ModelSurvSHAPMonitor",
+    "SurvivalModelExplainer",
+    "SurvSHAPResult",
+    "SurvSHAPStatistics",
+    "SurvSHAPResultStore",
+    "ForestCoalitionEvaluator",
+    "CoxCoalitionEvaluator",
+    "SurvSHAPSession",
+]
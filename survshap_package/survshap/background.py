@@ -0,0 +1,120 @@
+import numpy as np
+import pandas as pd
+from scipy.integrate import trapezoid
+from sklearn.cluster import KMeans
+
+
+def summarize_background(data, y, n_samples, method="kmeans", random_state=None):
+    if n_samples >= len(data):
+        return data, np.full(len(data), 1 / len(data))
+    if method == "kmeans":
+        summary, weights = kmeans_background(data, n_samples, random_state)
+    elif method == "kmedoids":
+        summary, weights = kmedoids_background(data, n_samples, random_state)
+    elif method == "stratified":
+        summary, weights = stratified_background(data, y, n_samples, random_state)
+    else:
+        raise ValueError("method should be 'kmeans', 'kmedoids' or 'stratified'")
+    return summary, weights / weights.sum()
+
+
+def kmeans_background(data, n_samples, random_state=None):
+    X, scale = standardized_values(data)
+    kmeans = KMeans(n_clusters=n_samples, n_init=10, random_state=random_state).fit(X)
+    centers = kmeans.cluster_centers_ * scale[1] + scale[0]
+
+    # like shap.kmeans, snap every coordinate of a center to the closest value observed in the data,
+    # so that integer and binary variables keep valid values
+    values = data.to_numpy(dtype=float)
+    for j in range(values.shape[1]):
+        observed = np.unique(values[:, j])
+        centers[:, j] = observed[np.abs(centers[:, j, None] - observed[None, :]).argmin(axis=1)]
+
+    summary = pd.DataFrame(centers, columns=data.columns).astype(data.dtypes.to_dict())
+    weights = np.bincount(kmeans.labels_, minlength=n_samples).astype(float)
+    return summary, weights
+
+
+def kmedoids_background(data, n_samples, random_state=None, max_iter=100):
+    X, _ = standardized_values(data)
+    rng = np.random.default_rng(random_state)
+
+    # k-means++ seeding followed by alternating assignment and medoid update steps
+    medoids = [rng.integers(len(X))]
+    min_distances = np.linalg.norm(X - X[medoids[0]], axis=1)
+    for _ in range(1, n_samples):
+        probabilities = min_distances**2 / np.sum(min_distances**2)
+        medoids.append(rng.choice(len(X), p=probabilities))
+        min_distances = np.minimum(min_distances, np.linalg.norm(X - X[medoids[-1]], axis=1))
+    medoids = np.array(medoids)
+
+    for _ in range(max_iter):
+        labels = pairwise_distances(X, X[medoids]).argmin(axis=1)
+        new_medoids = medoids.copy()
+        for k in range(n_samples):
+            members = np.flatnonzero(labels == k)
+            if len(members) > 0:
+                new_medoids[k] = members[pairwise_distances(X[members], X[members]).sum(axis=1).argmin()]
+        if np.array_equal(new_medoids, medoids):
+            break
+        medoids = new_medoids
+
+    labels = pairwise_distances(X, X[medoids]).argmin(axis=1)
+    weights = np.bincount(labels, minlength=n_samples).astype(float)
+    return data.iloc[medoids].reset_index(drop=True), weights
+
+
+def stratified_background(data, y, n_samples, random_state=None):
+    # strata are defined by the event indicator and quantiles of the observed time of every row of data
+    if len(y) != len(data):
+        raise ValueError(
+            "method='stratified' requires y with the event indicator and observed time of every row of data, "
+            f"got {len(y)} rows of y and {len(data)} rows of data"
+        )
+    rng = np.random.default_rng(random_state)
+    names = y.dtype.names
+    event_inds = np.asarray(y[names[0]], dtype=bool)
+    event_times = np.asarray(y[names[1]], dtype=float)
+    n_bins = max(1, int(np.sqrt(n_samples / 2)))
+    bins = np.quantile(event_times, np.linspace(0, 1, n_bins + 1)[1:-1])
+    strata = np.searchsorted(bins, event_times, side="right") * 2 + event_inds
+    labels, sizes = np.unique(strata, return_counts=True)
+
+    # largest remainder allocation of the samples proportional to stratum sizes, at least one per stratum
+    quotas = sizes / sizes.sum() * n_samples
+    allocation = np.maximum(np.floor(quotas).astype(int), 1)
+    order = np.argsort(quotas - np.floor(quotas))[::-1]
+    for k in order[: max(0, n_samples - allocation.sum())]:
+        allocation[k] += 1
+    allocation = np.minimum(allocation, sizes)
+
+    indices, weights = [], []
+    for label, size, n_selected in zip(labels, sizes, allocation):
+        members = np.flatnonzero(strata == label)
+        indices.extend(rng.choice(members, n_selected, replace=False))
+        weights.extend([size / n_selected] * n_selected)
+    return data.iloc[indices].reset_index(drop=True), np.array(weights)
+
+
+def standardized_values(data):
+    try:
+        X = data.to_numpy(dtype=float)
+    except (TypeError, ValueError):
+        raise TypeError("background summarization with clustering requires numeric data, use method='stratified'")
+    mean = X.mean(axis=0)
+    std = X.std(axis=0)
+    std[std == 0] = 1
+    return (X - mean) / std, (mean, std)
+
+
+def pairwise_distances(A, B):
+    return np.sqrt(np.maximum(np.sum(A**2, axis=1)[:, None] - 2 * A @ B.T + np.sum(B**2, axis=1)[None, :], 0))
+
+
+def background_summary_error(full_baseline, summary_baseline, timestamps):
+    abs_error = np.abs(full_baseline - summary_baseline)
+    return {
+        "max_abs_error": float(np.max(abs_error)),
+        "mean_abs_error": float(np.mean(abs_error)),
+        "integrated_abs_error": float(trapezoid(abs_error, timestamps)) if len(timestamps) > 1 else 0.0,
+    }
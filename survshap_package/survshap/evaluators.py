@@ -0,0 +1,265 @@
+import numpy as np
+from sksurv.ensemble import ExtraSurvivalTrees, RandomSurvivalForest
+from sksurv.linear_model import CoxnetSurvivalAnalysis, CoxPHSurvivalAnalysis
+from .explainer import evaluate_step_values, proportional_hazards_baseline
+from .treeshap import ensemble_trees, in_leaf_boxes
+
+
+class ForestCoalitionEvaluator:
+    def __init__(self, max_block_elements=2**20):
+        """Constructor for class ForestCoalitionEvaluator, coalition values of survival forests from cached leaf functions
+
+        A coalition row takes the variables of the coalition from the explained observation and the others from a background observation. It falls into a leaf when the explained observation satisfies the conditions of the leaf on the coalition variables and the background observation on the remaining ones, so mean predictions over the background are computed from leaf functions and counts of satisfied conditions, without building coalition rows or calling the model.
+
+        Args:
+            max_block_elements (int, optional): Maximum size of the (leaves x observations x coalitions) arrays, coalitions and observations are split into blocks to respect it. Defaults to 2**20.
+        """
+        self.max_block_elements = max_block_elements
+
+    def supports(self, explainer, function_type):
+        """Check whether coalition values of the explainer can be computed from leaf functions
+
+        Args:
+            explainer (SurvivalModelExplainer): A wrapper object for the model to be explained.
+            function_type (str): Either "sf" representing survival function or "chf" representing cumulative hazard function.
+
+        Returns:
+            bool: True for sksurv.ensemble.RandomSurvivalForest and sksurv.ensemble.ExtraSurvivalTrees models predicted with their own methods.
+        """
+        model = explainer.model
+        return (
+            isinstance(model, (RandomSurvivalForest, ExtraSurvivalTrees))
+            and not getattr(model, "low_memory", False)
+            and explainer._array_predict_method(function_type) is not None
+        )
+
+    def coalition_values(self, explainer, function_type, masks, new_observations, timestamps):
+        """Calculate mean predictions over the background for coalitions of explained observations
+
+        Args:
+            explainer (SurvivalModelExplainer): A wrapper object for the model to be explained.
+            function_type (str): Either "sf" representing survival function or "chf" representing cumulative hazard function.
+            masks (numpy.ndarray): Boolean array of shape (n_coalitions, n_variables), True for variables taken from the explained observation.
+            new_observations (pandas.DataFrame): Explained observations.
+            timestamps (numpy.Array): An array of timestamps at which the functions are evaluated.
+
+        Returns:
+            numpy.ndarray: Mean predictions of shape (n_observations, n_coalitions, n_timestamps).
+        """
+        trees = ensemble_trees(explainer)
+        knots = explainer.model.unique_times_
+        column = 1 if function_type == "sf" else 0
+        # trees compare float32 features with float64 thresholds
+        X = np.asarray(new_observations, dtype=np.float32).astype(float)
+        Z = np.asarray(explainer.data, dtype=np.float32).astype(float)
+        weights = np.ones(len(Z)) if explainer.background_weights is None else explainer.background_weights
+        weights = weights / weights.sum()
+        masks = np.asarray(masks, dtype=float)
+        values = np.concatenate([tree["values"][:, :, column] for tree in trees])
+        leaf_values = evaluate_step_values(knots, values, timestamps, (0, knots[-1])) / len(trees)
+
+        max_leaves = max(len(tree["leaves"]) for tree in trees)
+        n_masks = max(1, self.max_block_elements // (max_leaves * max(len(Z), len(X))))
+        n_rows = max(1, self.max_block_elements // (max_leaves * min(n_masks, len(masks))))
+        result = np.zeros((len(X), len(masks), len(timestamps)))
+        for m_start in range(0, len(masks), n_masks):
+            mask_block = masks[m_start : m_start + n_masks]
+            z_counts = [background_count_weights(tree, Z, weights, mask_block) for tree in trees]
+            for start in range(0, len(X), n_rows):
+                x_block = X[start : start + n_rows]
+                leaf_weights = np.concatenate(
+                    [coalition_leaf_weights(tree, x_block, mask_block, counts) for tree, counts in zip(trees, z_counts)]
+                )
+                result[start : start + len(x_block), m_start : m_start + len(mask_block)] = (
+                    leaf_weights.T @ leaf_values
+                ).reshape(len(x_block), len(mask_block), -1)
+        return result
+
+
+class CoxCoalitionEvaluator:
+    def __init__(
+        self,
+        coefficients=None,
+        offset=0.0,
+        baseline_survival=None,
+        baseline_cumulative_hazard=None,
+        max_block_elements=2**22,
+    ):
+        """Constructor for class CoxCoalitionEvaluator, coalition values of proportional hazards models in closed form
+
+        For a model with S(t | x) = S_0(t)^exp(eta(x)) and H(t | x) = H_0(t) exp(eta(x)), where eta(x) = x @ coefficients - offset, the linear predictor of a coalition row is the linear predictor of the background observation plus the change of the coalition variables, so mean predictions over the background are computed with numpy from linear predictors, without building coalition rows or calling the model.
+
+        Args:
+            coefficients (numpy.ndarray, optional): Coefficients of the linear predictor, one for every variable of the explainer data. Defaults to None (public `coef_` of a sksurv.linear_model.CoxPHSurvivalAnalysis or sksurv.linear_model.CoxnetSurvivalAnalysis model, for Coxnet those of the last alpha used by its predict methods by default, with linear predictors and the baseline obtained from its predictions).
+            offset (float, optional): Subtracted from the linear predictor. Used only with `coefficients`. Defaults to 0.0.
+            baseline_survival (function, optional): Function returning the baseline survival function S_0 at an array of timestamps. Used only with `coefficients`. Defaults to None (exp(-H_0)).
+            baseline_cumulative_hazard (function, optional): Function returning the baseline cumulative hazard function H_0 at an array of timestamps. Used only with `coefficients`. Defaults to None (-log(S_0)).
+            max_block_elements (int, optional): Maximum size of the intermediate (coalition rows x background observations x timestamps) arrays. Defaults to 2**22.
+        """
+        self.coefficients = coefficients
+        self.offset = offset
+        self.baseline_survival = baseline_survival
+        self.baseline_cumulative_hazard = baseline_cumulative_hazard
+        self.max_block_elements = max_block_elements
+
+    def supports(self, explainer, function_type):
+        """Check whether coalition values of the explainer can be computed from linear predictors
+
+        Args:
+            explainer (SurvivalModelExplainer): A wrapper object for the model to be explained.
+            function_type (str): Either "sf" representing survival function or "chf" representing cumulative hazard function.
+
+        Returns:
+            bool: True for a declared linear predictor and baseline, and for sksurv Cox models with a fitted baseline predicted with their own methods.
+        """
+        if self.coefficients is not None:
+            return self.baseline_survival is not None or self.baseline_cumulative_hazard is not None
+        model = explainer.model
+        if isinstance(model, CoxnetSurvivalAnalysis):
+            # predict methods of Coxnet need a baseline model for every alpha
+            if not model.fit_baseline_model:
+                return False
+        elif not isinstance(model, CoxPHSurvivalAnalysis):
+            return False
+        coefficients = getattr(model, "coef_", None)
+        if coefficients is None or len(coefficients) != explainer.data.shape[1]:
+            return False
+        return explainer._array_predict_method(function_type) is not None
+
+    def linear_predictor(self, explainer):
+        """Coefficients of the linear predictor and its values for the background data
+
+        Args:
+            explainer (SurvivalModelExplainer): A wrapper object for the model to be explained.
+
+        Returns:
+            tuple: Array of coefficients and array of linear predictors of the background observations.
+        """
+        if self.coefficients is not None:
+            coefficients = np.asarray(self.coefficients, dtype=float)
+            return coefficients, np.asarray(explainer.data, dtype=float) @ coefficients - self.offset
+        model = explainer.model
+        coefficients = model.coef_
+        if isinstance(model, CoxnetSurvivalAnalysis):
+            # predict methods use the last alpha of the path by default
+            coefficients = coefficients[:, -1]
+        return coefficients, model.predict(explainer.data)
+
+    def baseline(self, explainer, function_type, timestamps, background_linear_predictors):
+        """Baseline survival or cumulative hazard function
+
+        Args:
+            explainer (SurvivalModelExplainer): A wrapper object for the model to be explained.
+            function_type (str): Either "sf" representing survival function or "chf" representing cumulative hazard function.
+            timestamps (numpy.Array): An array of timestamps at which the function is evaluated.
+            background_linear_predictors (numpy.ndarray): Linear predictors of the background observations.
+
+        Returns:
+            numpy.ndarray: Values of S_0 or H_0 at `timestamps`.
+        """
+        if self.coefficients is None:
+            return proportional_hazards_baseline(explainer, function_type, timestamps, background_linear_predictors)
+        if function_type == "sf":
+            if self.baseline_survival is None:
+                return np.exp(-np.asarray(self.baseline_cumulative_hazard(timestamps), dtype=float))
+            return np.asarray(self.baseline_survival(timestamps), dtype=float)
+        if self.baseline_cumulative_hazard is None:
+            return -np.log(np.asarray(self.baseline_survival(timestamps), dtype=float))
+        return np.asarray(self.baseline_cumulative_hazard(timestamps), dtype=float)
+
+    def coalition_values(self, explainer, function_type, masks, new_observations, timestamps):
+        """Calculate mean predictions over the background for coalitions of explained observations
+
+        Args:
+            explainer (SurvivalModelExplainer): A wrapper object for the model to be explained.
+            function_type (str): Either "sf" representing survival function or "chf" representing cumulative hazard function.
+            masks (numpy.ndarray): Boolean array of shape (n_coalitions, n_variables), True for variables taken from the explained observation.
+            new_observations (pandas.DataFrame): Explained observations.
+            timestamps (numpy.Array): An array of timestamps at which the functions are evaluated.
+
+        Returns:
+            numpy.ndarray: Mean predictions of shape (n_observations, n_coalitions, n_timestamps).
+        """
+        coefficients, background_linear_predictors = self.linear_predictor(explainer)
+        baseline = self.baseline(explainer, function_type, timestamps, background_linear_predictors)
+        X = np.asarray(new_observations, dtype=float) * coefficients
+        Z = np.asarray(explainer.data, dtype=float) * coefficients
+        weights = np.ones(len(Z)) if explainer.background_weights is None else explainer.background_weights
+        weights = weights / weights.sum()
+        masks = np.asarray(masks, dtype=float)
+        # linear predictors of coalition rows are eta(z) - z_S @ beta_S + x_S @ beta_S
+        x_changes = (X @ masks.T).ravel()
+        z_changes = background_linear_predictors[:, None] - Z @ masks.T
+        coalitions = np.tile(np.arange(len(masks)), len(X))
+
+        n_pairs = len(x_changes)
+        if function_type == "chf":
+            block_size = max(1, self.max_block_elements // len(Z))
+            mean_hazard_ratios = np.empty(n_pairs)
+            for start in range(0, n_pairs, block_size):
+                stop = start + block_size
+                linear_predictors = z_changes[:, coalitions[start:stop]].T + x_changes[start:stop, None]
+                mean_hazard_ratios[start:stop] = np.exp(linear_predictors) @ weights
+            result = mean_hazard_ratios[:, None] * baseline
+        else:
+            with np.errstate(divide="ignore"):
+                log_baseline = np.log(baseline)
+            n_timestamps = max(1, min(len(baseline), self.max_block_elements // len(Z)))
+            block_size = max(1, self.max_block_elements // (len(Z) * n_timestamps))
+            result = np.empty((n_pairs, len(baseline)))
+            for start in range(0, n_pairs, block_size):
+                stop = start + block_size
+                hazard_ratios = np.exp(z_changes[:, coalitions[start:stop]].T + x_changes[start:stop, None])
+                for t_start in range(0, len(baseline), n_timestamps):
+                    t_stop = t_start + n_timestamps
+                    # S_0(t)^r = exp(r log S_0(t)), which is 0 where S_0(t) = 0
+                    result[start:stop, t_start:t_stop] = (
+                        np.exp(hazard_ratios[:, :, None] * log_baseline[None, None, t_start:t_stop]).transpose(0, 2, 1)
+                        @ weights
+                    )
+        return result.reshape(len(X), len(masks), len(baseline))
+
+
+def background_count_weights(tree, Z, weights, masks):
+    # (n_leaves, n_coalitions, n_features + 1) total weight of background observations satisfying k conditions of
+    # a leaf on the variables outside of the coalition
+    used = tree["features"]
+    n_used = len(used)
+    z_in_leaf = in_leaf_boxes(Z[:, used], tree["lower"], tree["upper"])
+    counts = np.matmul(z_in_leaf, (1 - masks[:, used]).T).astype(np.intp)
+    n_leaves, _, n_masks = counts.shape
+    index = (np.arange(n_leaves)[:, None, None] * n_masks + np.arange(n_masks)[None, None, :]) * (n_used + 1) + counts
+    return np.bincount(
+        index.ravel(), weights=np.broadcast_to(weights[None, :, None], counts.shape).ravel(), minlength=n_leaves * n_masks * (n_used + 1)
+    ).reshape(n_leaves, n_masks, n_used + 1)
+
+
+def coalition_leaf_weights(tree, X, masks, z_count_weights):
+    # (n_leaves, n_observations * n_coalitions) weight of a leaf in the mean prediction of a coalition, the background
+    # observations must satisfy all conditions of the leaf that the observation does not satisfy on the coalition
+    used = tree["features"]
+    n_used = len(used)
+    x_in_leaf = in_leaf_boxes(X[:, used], tree["lower"], tree["upper"])
+    x_counts = np.matmul(x_in_leaf, masks[:, used].T).astype(np.intp)
+    n_leaves, n_observations, n_masks = x_counts.shape
+    index = (
+        np.arange(n_leaves)[:, None, None] * n_masks + np.arange(n_masks)[None, None, :]
+    ) * (n_used + 1) + n_used - x_counts
+    return z_count_weights.take(index).reshape(n_leaves, n_observations * n_masks)
+
+
+def select_coalition_evaluator(explainer, function_type):
+    # the evaluator used by the kernel and sampling methods, None for predictions of coalition rows with the model
+    evaluator = explainer.coalition_evaluator
+    if isinstance(evaluator, str) and evaluator == "auto":
+        for evaluator in [ForestCoalitionEvaluator(), CoxCoalitionEvaluator()]:
+            if evaluator.supports(explainer, function_type):
+                return evaluator
+        return None
+    # evaluators passed explicitly are checked as well, supports is optional for user-defined ones
+    if evaluator is not None and hasattr(evaluator, "supports") and not evaluator.supports(explainer, function_type):
+        raise ValueError(
+            f"coalition_evaluator {type(evaluator).__name__} does not support this explainer and function_type"
+            f" '{function_type}', use coalition_evaluator='auto' or None"
+        )
+    return evaluator
@@ -1,3 +1,8 @@
+import inspect
+import numpy as np
+from .background import summarize_background, background_summary_error
+
+
 class SurvivalModelExplainer:
     def __init__(
         self,
@@ -6,12 +11,163 @@ class SurvivalModelExplainer:
         y,
         predict_survival_function=None,
         predict_cumulative_hazard_function=None,
+        batch_size=100000,
+        background_weights=None,
+        coalition_evaluator="auto",
     ):
+        """Constructor for class SurvivalModelExplainer
+
+        Args:
+            model (object): A survival model to be explained.
+            data (pandas.DataFrame): Background data used for calculating SurvSHAP(t) values.
+            y (numpy.ndarray): Structured array with the event indicator and observed time, e.g. of the data the model was trained on. Its event times are used to choose timestamps and it is aligned with `data` only when required by a method (e.g. `summarize_background` with method="stratified").
+            predict_survival_function (function, optional): Function taking `(model, data)` and returning survival functions. Defaults to None (`model.predict_survival_function` is used).
+            predict_cumulative_hazard_function (function, optional): Function taking `(model, data)` and returning cumulative hazard functions. Defaults to None (`model.predict_cumulative_hazard_function` is used).
+            batch_size (int, optional): Maximum number of rows passed to the model in a single prediction call when evaluating coalitions. Defaults to 100000.
+            background_weights (numpy.ndarray, optional): Weights of the rows of `data` used when averaging predictions over the background, e.g. cluster sizes of a summarized background. Reset to None when `data` is reassigned. With calculation_method="shap_kernel" they are passed to shap.KernelExplainer through the private class `shap.utils._legacy.DenseData`. Defaults to None (equal weights).
+            coalition_evaluator (object or str, optional): Object computing mean predictions over the background for coalitions of explained observations in the "kernel" and "sampling" methods, with a method `coalition_values(explainer, function_type, masks, new_observations, timestamps)` and optionally `supports(explainer, function_type)`, checked before it is used (see `ForestCoalitionEvaluator`). "auto" uses `ForestCoalitionEvaluator` for sksurv survival forests and `CoxCoalitionEvaluator` for sksurv Cox models, when they are predicted with their own methods, None always predicts coalition rows with the model. Defaults to "auto".
+        """
+        self._cache = {}
+        # incremented whenever the cache is cleared, so that objects keeping their own caches can detect it
+        self._cache_generation = 0
         self.model = model
         self.data = data
         self.y = y
         self.predict_survival_function = predict_survival_function
         self.predict_cumulative_hazard_function = predict_cumulative_hazard_function
+        self.batch_size = batch_size
+        self.background_weights = background_weights
+        self.coalition_evaluator = coalition_evaluator
+        self.background_summary_error = None
+
+    @property
+    def model(self):
+        return self._model
+
+    @model.setter
+    def model(self, value):
+        self._model = value
+        self.clear_cache()
+
+    @property
+    def data(self):
+        return self._data
+
+    @data.setter
+    def data(self, value):
+        self._data = value
+        # weights describe rows of the previous data
+        self._background_weights = None
+        self.clear_cache()
+
+    @property
+    def predict_survival_function(self):
+        return self._predict_survival_function
+
+    @predict_survival_function.setter
+    def predict_survival_function(self, value):
+        self._predict_survival_function = value
+        self.clear_cache()
+
+    @property
+    def predict_cumulative_hazard_function(self):
+        return self._predict_cumulative_hazard_function
+
+    @predict_cumulative_hazard_function.setter
+    def predict_cumulative_hazard_function(self, value):
+        self._predict_cumulative_hazard_function = value
+        self.clear_cache()
+
+    @property
+    def background_weights(self):
+        return self._background_weights
+
+    @background_weights.setter
+    def background_weights(self, value):
+        if value is not None:
+            value = np.asarray(value, dtype=float)
+            if value.shape != (len(self.data),):
+                raise ValueError("background_weights must have one weight for every row of data")
+        self._background_weights = value
+        self.clear_cache()
+
+    def summarize_background(self, n_samples, method="kmeans", function_type="sf", random_state=None):
+        """Create an explainer with a smaller, weighted background summarizing `data`
+
+        Args:
+            n_samples (int): Number of rows of the summarized background.
+            method (str, optional): One of "kmeans" (cluster centers snapped to observed values), "kmedoids" (observations closest to cluster centers) or "stratified" (sample stratified by the event indicator and quantiles of the observed time from `y`, which requires one row of `y` per row of `data`). Defaults to "kmeans".
+            function_type (str, optional): Either "sf" or "chf". Function used to report the accuracy of the summary. Defaults to "sf".
+            random_state (int, optional): Set seed for random number generator. Defaults to None.
+
+        Returns:
+            SurvivalModelExplainer: A new explainer with summarized `data` and `background_weights`. Its `background_summary_error` attribute contains the maximum, mean and integrated absolute differences between the baseline functions for the summarized and for the full background. `y` of the new explainer is `y` of this explainer, so it is not aligned with the summarized `data`.
+        """
+        summary, weights = summarize_background(self.data, self.y, n_samples, method, random_state)
+        explainer = SurvivalModelExplainer(
+            self.model,
+            summary,
+            self.y,
+            predict_survival_function=self.predict_survival_function,
+            predict_cumulative_hazard_function=self.predict_cumulative_hazard_function,
+            batch_size=self.batch_size,
+            background_weights=weights,
+            coalition_evaluator=self.coalition_evaluator,
+        )
+        timestamps = self.default_timestamps(function_type)
+        explainer.background_summary_error = background_summary_error(
+            self.baseline_function(function_type, timestamps),
+            explainer.baseline_function(function_type, timestamps),
+            timestamps,
+        )
+        return explainer
+
+    def clear_cache(self):
+        """Drop cached background predictions and baseline functions
+
+        The cache is cleared automatically when `model`, `data`, `background_weights`, `predict_survival_function` or
+        `predict_cumulative_hazard_function` is reassigned. Call this method after modifying them in place.
+        """
+        self._cache.clear()
+        self._cache_generation += 1
+
+    def background_predictions(self, function_type, timestamps=None):
+        """Predictions for the background data, cached per function type and timestamps
+
+        Args:
+            function_type (str): Either "sf" representing survival function or "chf" representing cumulative hazard function.
+            timestamps (numpy.Array, optional): An array of timestamps at which the functions are evaluated. Defaults to None (`default_timestamps` are used).
+
+        Returns:
+            numpy.ndarray: A read-only array of shape (n_background, n_timestamps).
+        """
+        timestamps = self.resolve_timestamps(function_type, timestamps)
+        key = ("background", function_type, np.asarray(timestamps, dtype=float).tobytes())
+        if key not in self._cache:
+            preds = self.predict_array(self.data, function_type, timestamps)
+            preds.flags.writeable = False
+            self._cache[key] = preds
+        return self._cache[key]
+
+    def baseline_function(self, function_type, timestamps=None):
+        """Mean prediction for the background data, cached per function type and timestamps
+
+        Args:
+            function_type (str): Either "sf" representing survival function or "chf" representing cumulative hazard function.
+            timestamps (numpy.Array, optional): An array of timestamps at which the functions are evaluated. Defaults to None (`default_timestamps` are used).
+
+        Returns:
+            numpy.ndarray: A read-only array of shape (n_timestamps,).
+        """
+        timestamps = self.resolve_timestamps(function_type, timestamps)
+        key = ("baseline", function_type, np.asarray(timestamps, dtype=float).tobytes())
+        if key not in self._cache:
+            baseline_f = np.average(
+                self.background_predictions(function_type, timestamps), axis=0, weights=self.background_weights
+            )
+            baseline_f.flags.writeable = False
+            self._cache[key] = baseline_f
+        return self._cache[key]
 
     def predict(self, data, function_type):
         if function_type == "sf":
@@ -36,3 +192,177 @@ class SurvivalModelExplainer:
                 )
         else:
             raise ValueError("function type needs to be one of `sf` or `chf`")
+
+    def predict_array(self, data, function_type, timestamps=None):
+        """Predict survival or cumulative hazard functions as a dense array
+
+        Args:
+            data (pandas.DataFrame): Observations for which functions are predicted.
+            function_type (str): Either "sf" representing survival function or "chf" representing cumulative hazard function.
+            timestamps (numpy.Array, optional): An array of timestamps at which the functions are evaluated. Defaults to None (the functions are evaluated at their own step knots, see `default_timestamps`).
+
+        Returns:
+            numpy.ndarray: An array of shape (n_observations, n_timestamps).
+        """
+        method = self._array_predict_method(function_type)
+        if method is not None:
+            values = method(data, return_array=True)
+            knots = self.model.unique_times_
+            if values.ndim == 2 and values.shape[1] == len(knots):
+                if timestamps is None:
+                    return values
+                return evaluate_step_values(knots, values, timestamps, (0, knots[-1]))
+        return step_functions_to_array(self.predict(data, function_type), timestamps)
+
+    def default_timestamps(self, function_type):
+        """Timestamps used when none are passed, i.e. the step knots of predicted functions
+
+        Args:
+            function_type (str): Either "sf" representing survival function or "chf" representing cumulative hazard function.
+
+        Returns:
+            numpy.ndarray: An array of timestamps.
+        """
+        key = ("timestamps", function_type)
+        if key not in self._cache:
+            if self._array_predict_method(function_type) is not None:
+                self._cache[key] = self.model.unique_times_
+            else:
+                self._cache[key] = self.predict(self.data.iloc[[0]], function_type)[0].x
+        return self._cache[key]
+
+    def resolve_timestamps(self, function_type, timestamps, return_error=False):
+        """Turn the `timestamps` argument of explanation methods into an array of timestamps
+
+        Args:
+            function_type (str): Either "sf" representing survival function or "chf" representing cumulative hazard function.
+            timestamps (numpy.Array or str, optional): An array of timestamps, None for `default_timestamps`, or one of "quantiles", "knots" or "tolerance" for a reduced grid chosen by `select_timestamps` with default settings.
+            return_error (bool, optional): Whether to return also the approximation error of a reduced grid (see `select_timestamps`), None for other timestamps. Defaults to False.
+
+        Returns:
+            numpy.ndarray or tuple: An array of timestamps, with the approximation error if `return_error` is True.
+        """
+        error = None
+        if timestamps is None:
+            timestamps = self.default_timestamps(function_type)
+        elif isinstance(timestamps, str):
+            # grids and their errors are cached together, per function type and method
+            key = ("selected_timestamps", function_type, timestamps)
+            if key not in self._cache:
+                self._cache[key] = self.select_timestamps(function_type, method=timestamps, return_error=True)
+            timestamps, error = self._cache[key]
+        else:
+            timestamps = np.asarray(timestamps)
+        return (timestamps, error) if return_error else timestamps
+
+    def select_timestamps(self, function_type="sf", method="tolerance", n_timestamps=100, tol=1e-3, return_error=False):
+        """Choose a reduced grid of timestamps out of `default_timestamps`
+
+        Args:
+            function_type (str, optional): Either "sf" representing survival function or "chf" representing cumulative hazard function. Defaults to "sf".
+            method (str, optional): One of "quantiles" (`n_timestamps` quantiles of the event times from `y`), "knots" (only timestamps at which any background prediction changes) or "tolerance" (a new timestamp is added only when any background prediction moved by more than `tol` since the last one). Defaults to "tolerance".
+            n_timestamps (int, optional): Number of quantiles for method "quantiles". Defaults to 100.
+            tol (float, optional): Maximum absolute change of background predictions between timestamps for method "tolerance". Defaults to 1e-3.
+            return_error (bool, optional): Whether to return also the error of approximating the background predictions on the full grid with step functions on the reduced grid. Defaults to False.
+
+        Returns:
+            numpy.ndarray or tuple: An array of timestamps, with a dict describing the approximation error if `return_error` is True.
+
+        Raises:
+            ValueError: if method is invalid, or method is "quantiles" and `y` contains no events
+        """
+        full_timestamps = np.asarray(self.default_timestamps(function_type))
+        preds = self.background_predictions(function_type, full_timestamps)
+
+        if method == "quantiles":
+            names = self.y.dtype.names
+            event_times = np.asarray(self.y[names[1]])[np.asarray(self.y[names[0]], dtype=bool)]
+            if len(event_times) == 0:
+                raise ValueError("method 'quantiles' requires at least one event in y")
+            quantiles = np.quantile(event_times, np.linspace(0, 1, n_timestamps))
+            idx = np.searchsorted(full_timestamps, quantiles, side="right") - 1
+            idx = np.unique(np.clip(idx, 0, len(full_timestamps) - 1))
+        elif method == "knots":
+            changes = np.any(np.diff(preds, axis=1) != 0, axis=0)
+            idx = np.concatenate(([0], np.flatnonzero(changes) + 1))
+        elif method == "tolerance":
+            idx = [0]
+            for i in range(1, preds.shape[1]):
+                if np.max(np.abs(preds[:, i] - preds[:, idx[-1]])) > tol:
+                    idx.append(i)
+            idx = np.array(idx)
+        else:
+            raise ValueError("method should be 'quantiles', 'knots' or 'tolerance'")
+
+        # every point of the full grid is approximated with the value at the last selected timestamp before it
+        approximation_idx = idx[np.maximum(np.searchsorted(idx, np.arange(len(full_timestamps)), side="right") - 1, 0)]
+        abs_error = np.abs(preds - preds[:, approximation_idx])
+        error = {
+            "function_type": function_type,
+            "method": method,
+            "n_timestamps": len(idx),
+            "n_full_timestamps": len(full_timestamps),
+            "max_abs_error": float(np.max(abs_error)),
+            "mean_abs_error": float(np.mean(abs_error)),
+        }
+        return (full_timestamps[idx], error) if return_error else full_timestamps[idx]
+
+    def _array_predict_method(self, function_type):
+        # sksurv models can return predictions evaluated at `unique_times_` without building StepFunctions
+        if function_type == "sf":
+            if self.predict_survival_function is not None:
+                return None
+            method = getattr(self.model, "predict_survival_function", None)
+        elif function_type == "chf":
+            if self.predict_cumulative_hazard_function is not None:
+                return None
+            method = getattr(self.model, "predict_cumulative_hazard_function", None)
+        else:
+            raise ValueError("function type needs to be one of `sf` or `chf`")
+        if method is None or not hasattr(self.model, "unique_times_"):
+            return None
+        try:
+            if "return_array" not in inspect.signature(method).parameters:
+                return None
+        except (TypeError, ValueError):
+            return None
+        return method
+
+
+def step_functions_to_array(functions, timestamps):
+    knots = functions[0].x
+    if timestamps is None:
+        timestamps = knots
+    shared_knots = all(
+        hasattr(f, "x") and hasattr(f, "y") and len(f.x) == len(knots) and np.array_equal(f.x, knots)
+        for f in functions
+    )
+    if not shared_knots:
+        return np.array([f(timestamps) for f in functions])
+
+    values = np.stack([getattr(f, "a", 1.0) * np.asarray(f.y) + getattr(f, "b", 0.0) for f in functions])
+    domains = [getattr(f, "domain", (0, knots[-1])) for f in functions]
+    domain = (max(d[0] for d in domains), min(d[1] for d in domains))
+    return evaluate_step_values(knots, values, timestamps, domain)
+
+
+def evaluate_step_values(knots, values, timestamps, domain):
+    # vectorized equivalent of sksurv.functions.StepFunction.__call__ for functions sharing knots
+    timestamps = np.atleast_1d(timestamps)
+    if not np.isfinite(timestamps).all():
+        raise ValueError("x must be finite")
+    if np.min(timestamps) < domain[0] or np.max(timestamps) > domain[1]:
+        raise ValueError(f"x must be within [{domain[0]:f}; {domain[1]:f}]")
+    idx = np.searchsorted(knots, np.clip(timestamps, knots[0], None), side="right") - 1
+    return values[:, idx]
+
+
+def proportional_hazards_baseline(explainer, function_type, timestamps, background_risk_scores):
+    # S(t | x) = S_0(t)^exp(f(x)) and H(t | x) = H_0(t) exp(f(x)), so the baseline follows from the public prediction
+    # for one background row, the one with the risk score closest to 0 loses the least precision
+    i = int(np.argmin(np.abs(background_risk_scores)))
+    values = explainer.predict_array(explainer.data.iloc[[i]], function_type, timestamps)[0]
+    hazard_ratio = np.exp(background_risk_scores[i])
+    if function_type == "sf":
+        return values ** (1 / hazard_ratio)
+    return values / hazard_ratio
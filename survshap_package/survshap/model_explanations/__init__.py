@@ -1,5 +1,7 @@
 from .object import ModelSurvSHAP
+from .monitor import ModelSurvSHAPMonitor
 
 __all__ = [
-  "ModelSurvSHAP"
+  "ModelSurvSHAP",
+  "ModelSurvSHAPMonitor"
 ]
\ No newline at end of file
@@ -0,0 +1,163 @@
+import hashlib
+import io
+import json
+import marshal
+import os
+import pickle
+import types
+import numpy as np
+import pandas as pd
+from ..streaming import SurvSHAPResultStore
+from .utils import calculate_individual_explanations, make_individual_explanations
+
+
+def calculate_explanations_with_checkpoints(
+    explainer,
+    new_observations,
+    function_type,
+    path,
+    B,
+    max_shap_value_inputs,
+    random_state,
+    calculation_method,
+    aggregation_method,
+    timestamps,
+    save_individual_explanations,
+    checkpoint_dir,
+    checkpoint_every=100,
+    n_jobs=None,
+    **kwargs,
+):
+    # observations are explained in consecutive blocks of checkpoint_every rows; after every block its results are
+    # appended to a store in checkpoint_dir and the progress file is replaced, so a resumed run starts after the
+    # last completed block
+    timestamps = explainer.resolve_timestamps(function_type, timestamps)
+    settings = {
+        "function_type": function_type,
+        "calculation_method": calculation_method,
+        "aggregation_method": aggregation_method,
+        "path": path if path is None or isinstance(path, str) else [int(j) for j in path],
+        "B": B,
+        "max_shap_value_inputs": str(max_shap_value_inputs),
+        "random_state": random_state,
+        "checkpoint_every": checkpoint_every,
+        "variable_names": [str(name) for name in explainer.data.columns],
+        "n_observations": len(new_observations),
+        "observations_hash": hash_frame(new_observations),
+        "background_hash": hash_frame(explainer.data),
+        "timestamps_hash": hashlib.sha256(np.asarray(timestamps, dtype=float).tobytes()).hexdigest(),
+        "model_hash": hash_object(explainer.model),
+        "background_weights_hash": hash_object(explainer.background_weights),
+        "coalition_evaluator_hash": hash_object(explainer.coalition_evaluator),
+        "predict_survival_function_hash": hash_object(explainer.predict_survival_function),
+        "predict_cumulative_hazard_function_hash": hash_object(explainer.predict_cumulative_hazard_function),
+        "kwargs_hash": hash_object(kwargs),
+    }
+
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    progress_file = os.path.join(checkpoint_dir, "progress.json")
+    if os.path.exists(progress_file):
+        with open(progress_file) as f:
+            progress = json.load(f)
+        if progress["settings"] != json.loads(json.dumps(settings)):
+            raise ValueError("checkpoint_dir contains a checkpoint of a different explanation")
+    else:
+        # with random_state=None a seed is drawn once and saved, so that a resumed run uses the same random numbers
+        seed = random_state
+        if seed is None:
+            seed = int(np.random.SeedSequence().generate_state(1)[0])
+        progress = {"settings": settings, "seed": seed, "completed": []}
+        write_progress(progress_file, progress)
+
+    store = SurvSHAPResultStore(os.path.join(checkpoint_dir, "results"))
+    n_observations = len(new_observations)
+    # blocks are written to the store before the progress file, so the store decides what is completed
+    n_completed = min(len(store) * checkpoint_every, n_observations)
+    progress["completed"] = [
+        [start, min(start + checkpoint_every, n_observations)] for start in range(0, n_completed, checkpoint_every)
+    ]
+    for start in range(n_completed, n_observations, checkpoint_every):
+        stop = min(start + checkpoint_every, n_observations)
+        result, _, _ = calculate_individual_explanations(
+            explainer,
+            new_observations.iloc[start:stop],
+            function_type,
+            path,
+            B,
+            max_shap_value_inputs,
+            progress["seed"],
+            calculation_method,
+            aggregation_method,
+            timestamps,
+            False,
+            n_jobs,
+            **kwargs,
+        )
+        store.append(result)
+        progress["completed"].append([start, stop])
+        write_progress(progress_file, progress)
+
+    result = store.load()
+    individual_explanations = []
+    if save_individual_explanations:
+        individual_explanations = make_individual_explanations(
+            explainer,
+            new_observations,
+            result,
+            function_type,
+            calculation_method,
+            aggregation_method,
+            max_shap_value_inputs,
+            progress["seed"],
+        )
+    return result, individual_explanations, timestamps
+
+
+def write_progress(progress_file, progress):
+    tmp_file = progress_file + ".tmp"
+    with open(tmp_file, "w") as f:
+        json.dump(progress, f)
+    os.replace(tmp_file, progress_file)
+
+
+def hash_frame(data):
+    return hashlib.sha256(pd.util.hash_pandas_object(data, index=False).to_numpy().tobytes()).hexdigest()
+
+
+def hash_object(obj):
+    # functions are compared by their code, as pickle keeps only the name of a function defined in a module, other
+    # objects, e.g. models, by their pickled state; items of dicts and lists are hashed one by one, as they may be
+    # functions
+    if isinstance(obj, dict):
+        content = hash_object([[str(key), obj[key]] for key in sorted(obj, key=str)]).encode()
+    elif isinstance(obj, (list, tuple)):
+        content = "".join(hash_object(item) for item in obj).encode()
+    elif isinstance(obj, types.FunctionType):
+        content = marshal.dumps(obj.__code__) + hash_object(obj.__defaults__).encode()
+        if obj.__closure__ is not None:
+            content += hash_object([cell.cell_contents for cell in obj.__closure__]).encode()
+    else:
+        buffer = io.BytesIO()
+        try:
+            FingerprintPickler(buffer).dump(obj)
+        except Exception as e:
+            raise TypeError(
+                f"checkpoint_dir requires a model, background_weights, coalition_evaluator, predict functions and "
+                f"additional parameters that can be pickled, got {type(obj).__name__}"
+            ) from e
+        content = buffer.getvalue()
+    return hashlib.sha256(content).hexdigest()
+
+
+class FingerprintPickler(pickle.Pickler):
+    # the pickled state does not depend on how the object was created or loaded: shared objects are written in full
+    # every time (fast mode), as loading may create copies of them, and structured arrays are written field by field,
+    # as their padding bytes, e.g. in the nodes of scikit-learn trees, are not initialized
+    def __init__(self, file):
+        super().__init__(file)
+        self.fast = True
+
+    def reducer_override(self, obj):
+        if isinstance(obj, np.ndarray) and obj.dtype.names is not None:
+            return list, ([str(obj.dtype.descr)] + [np.ascontiguousarray(obj[name]) for name in obj.dtype.names],)
+        return NotImplemented
@@ -0,0 +1,120 @@
+from collections import deque
+import numpy as np
+import pandas as pd
+from .object import ModelSurvSHAP
+from .utils import aggregate_change, make_mean_abs_shap_values_frame
+from ..result import SurvSHAPStatistics
+
+
+class ModelSurvSHAPMonitor:
+    def __init__(self, survshap=None, n_windows=7, threshold=0.02):
+        """Constructor for class ModelSurvSHAPMonitor, global SurvSHAP(t) importance over a sliding window of time periods
+
+        Observations are explained with `survshap` and only running statistics of every window (for example a day) are kept, in a ring buffer of the last `n_windows` windows.
+
+        Args:
+            survshap (ModelSurvSHAP, optional): Object used to explain new observations, its settings (function_type, calculation_method, aggregation_method, ...) are used for all windows. Defaults to None (ModelSurvSHAP with default settings).
+            n_windows (int, optional): Number of most recent windows kept. Defaults to 7.
+            threshold (float, optional): A variable is flagged when the maximum over time of the absolute difference between its mean absolute SurvSHAP(t) curve in the current window and in the preceding windows exceeds this value. Defaults to 0.02.
+        """
+        self.survshap = ModelSurvSHAP() if survshap is None else survshap
+        self.n_windows = n_windows
+        self.threshold = threshold
+        self.windows = deque(maxlen=n_windows)
+        self.window_labels = deque(maxlen=n_windows)
+
+    @property
+    def timestamps(self):
+        return self.survshap.timestamps
+
+    def update(self, explainer, new_observations, window=None, timestamps=None, n_jobs=None, **kwargs):
+        """Explain new observations and add them to a window
+
+        Args:
+            explainer (SurvivalModelExplainer): A wrapper object for the model to be explained.
+            new_observations (pandas.DataFrame): A DataFrame containing the new observations.
+            window (hashable, optional): Label of the window of the new observations, for example a date. If it differs from the label of the current window, a new window is started and the oldest window is dropped when there are already `n_windows` windows. Defaults to None (the current window, or a new window labelled 0 if there are no windows).
+            timestamps (numpy.Array or str, optional): Timestamps at which SurvSHAP(t) values should be calculated, used only for the first observations (see `ModelSurvSHAP.partial_fit`). Defaults to None.
+            n_jobs (int, optional): Number of worker processes used with calculation_method "kernel" or "sampling". Defaults to None (1 process).
+            **kwargs (optional): Additional parameters passed for shap.KernelExplainer.
+
+        Returns:
+            SurvSHAPResult: SurvSHAP(t) values for the new observations.
+        """
+        result = self.survshap.partial_fit(explainer, new_observations, timestamps, n_jobs, **kwargs)
+        if not self.windows or (window is not None and window != self.window_labels[-1]):
+            self.windows.append(SurvSHAPStatistics(result.variable_names, result.timestamps))
+            self.window_labels.append(0 if window is None else window)
+        self.windows[-1].update(result)
+        return result
+
+    def rolling_statistics(self, n_windows=None):
+        """Combine statistics of the most recent windows
+
+        Args:
+            n_windows (int, optional): Number of most recent windows to be combined. Defaults to None (all kept windows).
+
+        Returns:
+            SurvSHAPStatistics: Statistics of all observations in these windows.
+        """
+        windows = list(self.windows)
+        return combine_statistics(windows[-n_windows:] if n_windows else windows)
+
+    def rolling_result(self, n_windows=None, aggregation_method=None):
+        """Calculate mean absolute SurvSHAP(t) values over the most recent windows
+
+        Args:
+            n_windows (int, optional): Number of most recent windows. Defaults to None (all kept windows).
+            aggregation_method (str, optional): Method of aggregating the curves over time, see `ModelSurvSHAP`. Defaults to None (aggregation_method of `survshap`).
+
+        Returns:
+            pandas.DataFrame: Mean absolute SurvSHAP(t) values in the form of `ModelSurvSHAP.result`.
+        """
+        if aggregation_method is None:
+            aggregation_method = self.survshap.aggregation_method
+        return make_mean_abs_shap_values_frame(self.rolling_statistics(n_windows), aggregation_method)
+
+    def drift(self):
+        """Compare mean absolute SurvSHAP(t) curves of the current window with the preceding kept windows
+
+        Returns:
+            pandas.DataFrame: For every variable aggregated change of the curve in the preceding windows (`reference_aggregated_change`) and in the current window (`aggregated_change`), maximum absolute difference of the curves (`distance`) and whether it exceeds `threshold` (`flagged`). Sorted by `distance`.
+
+        Raises:
+            ValueError: if there are less than 2 windows
+        """
+        if len(self.windows) < 2:
+            raise ValueError("drift requires at least 2 windows")
+        current = self.windows[-1]
+        reference = combine_statistics(list(self.windows)[:-1])
+        reference_curves = reference.mean_abs_shap_values()
+        current_curves = current.mean_abs_shap_values()
+        distance = np.max(np.abs(current_curves - reference_curves), axis=1)
+        aggregation_method = self.survshap.aggregation_method
+        result = pd.DataFrame(
+            {
+                "variable_name": current.variable_names,
+                "reference_aggregated_change": aggregate_change(reference_curves, aggregation_method, self.timestamps),
+                "aggregated_change": aggregate_change(current_curves, aggregation_method, self.timestamps),
+                "distance": distance,
+                "flagged": distance > self.threshold,
+            }
+        )
+        return result.sort_values("distance", ascending=False, ignore_index=True)
+
+    def flagged_variables(self):
+        """Find variables whose curves in the current window moved beyond `threshold`
+
+        Returns:
+            list: Names of the flagged variables, the largest change first.
+        """
+        drift = self.drift()
+        return list(drift.loc[drift["flagged"], "variable_name"])
+
+
+def combine_statistics(windows):
+    # sums of a few windows are added on demand, which costs O(n_windows * p * T)
+    statistics = SurvSHAPStatistics(windows[0].variable_names, windows[0].timestamps)
+    for window_statistics in windows:
+        statistics.merge(window_statistics)
+    return statistics
@@ -1,8 +1,10 @@
 from .plot import model_plot_mean_abs_shap_values, model_plot_shap_lines_for_all_individuals
-import pandas as pd
 import numpy as np
 import pandas as pd
-from .utils import aggregate_change, calculate_individual_explanations
+from .utils import calculate_individual_explanations, make_mean_abs_shap_values_frame
+from .checkpoint import calculate_explanations_with_checkpoints
+from ..result import SurvSHAPStatistics
+from ..streaming import SurvSHAPResultStore, read_observation_chunks
 import warnings
 
 
@@ -21,7 +23,7 @@ class ModelSurvSHAP:
 
         Args:
             function_type (str, optional): Either "sf" representing survival function or "chf" representing cumulative hazard function. Type of function to be evaluated for explanation. Defaults to "sf".
-            calculation_method (str, optional): Chooses the method for SurvSHAP(t) calculation. "shap_kernel" for shap.KernelExplainer, "kernel" for exact KernelSHAP, "sampling" for sampling method, or "treeshap" for shap.TreeExplainer. Defaults to "kernel".
+            calculation_method (str, optional): Chooses the method for SurvSHAP(t) calculation. "shap_kernel" for shap.KernelExplainer, "kernel" for exact KernelSHAP, "sampling" for sampling method, or "treeshap" for interventional TreeSHAP of sksurv tree ensembles (RandomSurvivalForest, ExtraSurvivalTrees or GradientBoostingSurvivalAnalysis with loss="coxph"; for gradient boosting the values are an approximation, TreeSHAP values of the log-risk rescaled to the function). Defaults to "kernel".
             aggregation_method (str, optional): One of "sum_of_squares", "max_abs", "mean_abs" or "integral". Type of method  Defaults to "integral".
             path (list of int or str, optional): If specified, then attributions for this path will be plotted. Defaults to "average".
             B (int, optional): Number of random paths to calculate variable attributions. Defaults to 25.
@@ -40,40 +42,65 @@ class ModelSurvSHAP:
         self.random_state = random_state
         self.event_ind = None  # full y
         self.event_times = None  # full y
-        self.full_result = None
+        self.survshap_result = None
+        self.statistics = None
+
+    @property
+    def survshap_result(self):
+        return self._survshap_result
+
+    @survshap_result.setter
+    def survshap_result(self, value):
+        # full_result is built from the array-backed result only when it is used
+        self._survshap_result = value
+        self._full_result = None
+
+    @property
+    def full_result(self):
+        if self._full_result is None and self.survshap_result is not None:
+            self._full_result = self.survshap_result.to_frame(add_index=True)
+        return self._full_result
+
+    @full_result.setter
+    def full_result(self, value):
+        self._full_result = value
 
     def _repr_html_(self):
         return self.result[self.result["B"] == 0]._repr_html_()
 
-    def fit(self, explainer, new_observations=None, timestamps=None, save_individual_explanations=True, **kwargs):
+    def fit(
+        self,
+        explainer,
+        new_observations=None,
+        timestamps=None,
+        save_individual_explanations=True,
+        n_jobs=None,
+        checkpoint_dir=None,
+        checkpoint_every=100,
+        **kwargs,
+    ):
         """Calculate SurvSHAP(t) for many new observations and aggregate results.
 
         Args:
             explainer (SurvivalModelExplainer): A wrapper object for the model to be explained.
             new_observations (pandas.DataFrame, optional): A DataFrame containing the observations to be explained. If None observations from explainer are explained. Defaults to None.
-            timestamps (numpy.Array, optional): An array of timestamps at which SurvSHAP(t) values should be calculated. Defaults to None.
+            timestamps (numpy.Array or str, optional): An array of timestamps at which SurvSHAP(t) values should be calculated, or one of "quantiles", "knots" or "tolerance" to choose a reduced grid automatically (see `SurvivalModelExplainer.select_timestamps`). Defaults to None.
             save_individual_explanations (bool, optional): Whether to save PredictSurvSHAP objects (explanations for individual observations). Defaults to True.
+            n_jobs (int, optional): Number of worker processes used with calculation_method "kernel" or "sampling". Observations are split into chunks explained in parallel; the model is sent once to every worker and numeric background data are shared through shared memory. Results do not depend on `n_jobs`. Defaults to None (1 process).
+            checkpoint_dir (str, optional): Path to a directory for checkpoints. Observations are explained in blocks of `checkpoint_every` rows and results of every completed block are saved in this directory, together with the seed of the random number generator. If the directory already contains a checkpoint of the same explanation (same settings, observations, model, background data and weights, coalition evaluator, predict functions and additional parameters), completed blocks are skipped and the result is identical to an uninterrupted run. Individual explanations are then rebuilt from the saved values. Defaults to None (no checkpoints).
+            checkpoint_every (int, optional): Number of observations in a block between checkpoints. Defaults to 100.
             **kwargs (optional): Additional parameters passed for shap.KernelExplainer.
-        """
-        # based on original shap warning
-        data_len = len(explainer.data)
 
-        if data_len > 100 and self.calculation_method != "treeshap":
-            warnings.warn(
-                "Using "
-                + str(data_len)
-                + " background data samples could cause slower run times.\n"
-                + "Consider using a smaller sample."
-            )
+        Raises:
+            ValueError: if `checkpoint_dir` contains a checkpoint of a different explanation
+            TypeError: if `checkpoint_dir` is set and the model, background weights, coalition evaluator or additional parameters cannot be pickled
+        """
+        self._check_background_size(explainer)
 
         if new_observations is None:
             new_observations = explainer.data
 
-        (
-            self.full_result,
-            self.individual_explanations,
-            self.timestamps,
-        ) = calculate_individual_explanations(
+        args = (
             explainer,
             new_observations,
             self.function_type,
@@ -85,44 +112,118 @@ class ModelSurvSHAP:
             self.aggregation_method,
             timestamps,
             save_individual_explanations,
-            **kwargs
         )
+        if checkpoint_dir is None:
+            (
+                self.survshap_result,
+                self.individual_explanations,
+                self.timestamps,
+            ) = calculate_individual_explanations(*args, n_jobs, **kwargs)
+        else:
+            (
+                self.survshap_result,
+                self.individual_explanations,
+                self.timestamps,
+            ) = calculate_explanations_with_checkpoints(*args, checkpoint_dir, checkpoint_every, n_jobs, **kwargs)
 
         names = explainer.y.dtype.names
         self.event_ind = explainer.y[names[0]]
         self.event_times = explainer.y[names[1]]
 
-        result = self.full_result.copy()
+        self.statistics = SurvSHAPStatistics(explainer.data.columns, self.timestamps)
+        self.statistics.update(self.survshap_result)
+        self.get_mean_abs_shap_values(self.aggregation_method)
+
+    def partial_fit(self, explainer, new_observations, timestamps=None, n_jobs=None, **kwargs):
+        """Calculate SurvSHAP(t) for new observations only and add them to the running aggregates
+
+        `statistics` and `result` (mean absolute SurvSHAP(t) values) are updated in place, observations explained by earlier calls to `fit` or `partial_fit` are not explained again. `survshap_result`, `full_result` and individual explanations would describe only a part of the observations, so they are cleared.
+
+        Args:
+            explainer (SurvivalModelExplainer): A wrapper object for the model to be explained.
+            new_observations (pandas.DataFrame): A DataFrame containing the new observations to be explained.
+            timestamps (numpy.Array or str, optional): An array of timestamps at which SurvSHAP(t) values should be calculated, or one of "quantiles", "knots" or "tolerance" to choose a reduced grid automatically (see `SurvivalModelExplainer.select_timestamps`). Used only if there are no aggregates yet, later calls use the timestamps of the aggregates. Defaults to None.
+            n_jobs (int, optional): Number of worker processes used with calculation_method "kernel" or "sampling". Defaults to None (1 process).
+            **kwargs (optional): Additional parameters passed for shap.KernelExplainer.
 
-        result = (
-            result[result["B"] == 0]
-            .drop("variable_str", axis=1)
-            .groupby(["variable_name"])
-            .agg(lambda x: x.abs().mean())
-            .reset_index()
+        Returns:
+            SurvSHAPResult: SurvSHAP(t) values for the new observations.
+        """
+        if self.statistics is None:
+            self._check_background_size(explainer)
+            names = explainer.y.dtype.names
+            self.event_ind = explainer.y[names[0]]
+            self.event_times = explainer.y[names[1]]
+        else:
+            timestamps = self.timestamps
+        self.survshap_result = None
+        self.individual_explanations = []
+
+        result, _, timestamps = calculate_individual_explanations(
+            explainer,
+            new_observations,
+            self.function_type,
+            self.path,
+            self.B,
+            self.max_shap_value_inputs,
+            self.random_state,
+            self.calculation_method,
+            self.aggregation_method,
+            timestamps,
+            False,
+            n_jobs,
+            **kwargs,
         )
+        if self.statistics is None:
+            self.timestamps = timestamps
+            self.statistics = SurvSHAPStatistics(explainer.data.columns, timestamps)
+        self.statistics.update(result)
+        self.get_mean_abs_shap_values(self.aggregation_method)
+        return result
+
+    def fit_stream(self, explainer, source, chunk_size=1000, timestamps=None, sink=None, n_jobs=None, **kwargs):
+        """Calculate SurvSHAP(t) chunk by chunk, keeping only running aggregates in memory
+
+        This is a generator, explanations are calculated while it is iterated over. After every chunk `statistics` and `result` (mean absolute SurvSHAP(t) values) include all observations explained so far. Individual explanations and `full_result` are not kept.
+
+        Args:
+            explainer (SurvivalModelExplainer): A wrapper object for the model to be explained.
+            source (pandas.DataFrame or str): Observations to be explained, or a path to a parquet file (read by row groups, requires pyarrow) or a CSV file with them.
+            chunk_size (int, optional): Maximum number of observations explained at once. Defaults to 1000.
+            timestamps (numpy.Array or str, optional): An array of timestamps at which SurvSHAP(t) values should be calculated, or one of "quantiles", "knots" or "tolerance" to choose a reduced grid automatically (see `SurvivalModelExplainer.select_timestamps`). Defaults to None.
+            sink (str, optional): Path to a directory to which results of every chunk are appended, see `SurvSHAPResultStore`. Defaults to None (results are not written).
+            n_jobs (int, optional): Number of worker processes used for every chunk with calculation_method "kernel" or "sampling". Defaults to None (1 process).
+            **kwargs (optional): Additional parameters passed for shap.KernelExplainer.
 
-        result["aggregated_change"] = aggregate_change(result.iloc[:, 5:], self.aggregation_method, self.timestamps)
-        result = result.sort_values("aggregated_change", ascending=False)
-        self.result = result
+        Yields:
+            SurvSHAPResult: SurvSHAP(t) values for a chunk of observations.
+        """
+        self.statistics = None
+        store = None if sink is None else SurvSHAPResultStore(sink)
+
+        for chunk in read_observation_chunks(source, chunk_size):
+            result = self.partial_fit(explainer, chunk, timestamps, n_jobs, **kwargs)
+            if store is not None:
+                store.append(result)
+            yield result
+
+    def _check_background_size(self, explainer):
+        # based on original shap warning
+        data_len = len(explainer.data)
+
+        if data_len > 100 and self.calculation_method != "treeshap":
+            warnings.warn(
+                "Using "
+                + str(data_len)
+                + " background data samples could cause slower run times.\n"
+                + "Consider using a smaller sample, e.g. `explainer.summarize_background(n_samples)`."
+            )
 
     def get_mean_abs_shap_values(
         self,
         aggregation_method="sum_of_squares",
     ):
-        result = self.full_result.copy()
-
-        result = (
-            result[result["B"] == 0]
-            .drop("variable_str", axis=1)
-            .groupby(["variable_name"])
-            .agg(lambda x: x.abs().mean())
-            .reset_index()
-        )
-
-        result["aggregated_change"] = aggregate_change(result.iloc[:, 5:], aggregation_method, self.timestamps)
-        result = result.sort_values("aggregated_change", ascending=False)
-        self.result = result
+        self.result = make_mean_abs_shap_values_frame(self.statistics, aggregation_method)
 
     def plot_mean_abs_shap_values(
         self,
@@ -136,8 +237,13 @@ class ModelSurvSHAP:
     ):
         if len(self.result) == 0:
             self.get_mean_abs_shap_values()
+        variable_names = self.result["variable_name"].values
+        order = self.statistics.variable_names.get_indexer(variable_names)
         return model_plot_mean_abs_shap_values(
-            self.result,
+            variable_names,
+            self.result["variable_value"].values,
+            self.statistics.mean_abs_shap_values()[order],
+            self.result["aggregated_change"].values,
             self.timestamps,
             self.event_ind,
             self.event_times,
@@ -161,8 +267,14 @@ class ModelSurvSHAP:
         show=True,
         title=None,
     ):
+        if self.survshap_result is None:
+            raise ValueError("SurvSHAP(t) values of individual observations are not kept by partial_fit or fit_stream")
+        if variable not in self.survshap_result.variable_names:
+            raise ValueError("Variable not in the result")
+        j = self.survshap_result.variable_names.get_loc(variable)
         return model_plot_shap_lines_for_all_individuals(
-            self.full_result,
+            self.survshap_result.shap_values[:, :, j],
+            self.survshap_result.variable_values[:, j],
             self.timestamps,
             self.event_ind,
             self.event_times,
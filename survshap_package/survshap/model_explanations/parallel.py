@@ -0,0 +1,105 @@
+import inspect
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+import pandas as pd
+from ..explainer import SurvivalModelExplainer
+
+# state of a worker process, set once by init_worker
+_worker = {}
+
+
+def map_observation_chunks(explainer, new_observations, function, args, function_type, timestamps, n_workers):
+    # yields function(explainer, chunk, *args) for consecutive chunks of new_observations, in order;
+    # the model is sent once to every worker, numeric background data, observations and cached background
+    # predictions are placed in shared memory instead of being pickled for every task
+    blocks = []
+    try:
+        data_spec = share_frame(explainer.data, blocks)
+        observations_spec = share_frame(new_observations, blocks)
+        cache_spec = [
+            (
+                (kind, function_type, np.asarray(timestamps, dtype=float).tobytes()),
+                share_array(method(function_type, timestamps), blocks),
+            )
+            for kind, method in [
+                ("background", explainer.background_predictions),
+                ("baseline", explainer.baseline_function),
+            ]
+        ]
+        explainer_kwargs = {
+            "predict_survival_function": explainer.predict_survival_function,
+            "predict_cumulative_hazard_function": explainer.predict_cumulative_hazard_function,
+            "batch_size": explainer.batch_size,
+            "background_weights": explainer.background_weights,
+            "coalition_evaluator": explainer.coalition_evaluator,
+        }
+        # a few chunks per worker balance the load when observations take different times
+        chunks = np.array_split(np.arange(len(new_observations)), min(len(new_observations), 4 * n_workers))
+        with ProcessPoolExecutor(
+            max_workers=n_workers,
+            initializer=init_worker,
+            initargs=(explainer.model, data_spec, explainer.y, explainer_kwargs, cache_spec, observations_spec),
+        ) as executor:
+            futures = [
+                executor.submit(run_chunk, function, chunk[0], chunk[-1] + 1, args) for chunk in chunks if len(chunk)
+            ]
+            for future in futures:
+                yield future.result()
+    finally:
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
+
+
+def init_worker(model, data_spec, y, explainer_kwargs, cache_spec, observations_spec):
+    _worker["blocks"] = []
+    explainer = SurvivalModelExplainer(model, attach_frame(data_spec), y, **explainer_kwargs)
+    for key, spec in cache_spec:
+        explainer._cache[key] = attach_array(spec)
+    _worker["explainer"] = explainer
+    _worker["new_observations"] = attach_frame(observations_spec)
+
+
+def run_chunk(function, start, stop, args):
+    result = function(_worker["explainer"], _worker["new_observations"].iloc[start:stop], *args)
+    return list(result) if inspect.isgenerator(result) else result
+
+
+def share_frame(data, blocks):
+    # numeric columns are moved to shared memory, other columns are pickled with the spec
+    columns = []
+    for name in data.columns:
+        values = data[name].to_numpy()
+        if values.dtype.kind in "biuf":
+            columns.append((name, share_array(values, blocks), None))
+        else:
+            columns.append((name, None, data[name]))
+    return data.index, columns
+
+
+def attach_frame(spec):
+    index, columns = spec
+    return pd.DataFrame(
+        {name: attach_array(shared) if shared is not None else values for name, shared, values in columns},
+        index=index,
+        copy=False,
+    )
+
+
+def share_array(array, blocks):
+    array = np.ascontiguousarray(array)
+    shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    blocks.append(shm)
+    np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+    return shm.name, array.shape, array.dtype.str
+
+
+def attach_array(spec):
+    name, shape, dtype = spec
+    # workers share the resource tracker of the parent process, which unlinks the blocks
+    shm = shared_memory.SharedMemory(name=name)
+    _worker["blocks"].append(shm)
+    array = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    array.flags.writeable = False
+    return array
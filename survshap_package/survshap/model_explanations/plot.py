@@ -9,10 +9,6 @@ from matplotlib.colors import LinearSegmentedColormap, Normalize
 import itertools
 
 
-def tooltip_text(row):
-    return f"<b>{row.variable_name}</b><br>" + f"Value: {row.variable_value:.6f}<br>"
-
-
 def check_y_range(max_y, min_y, new_vector):
     tmp_max = np.max(new_vector)
     tmp_min = np.min(new_vector)
@@ -38,7 +34,10 @@ def insert_zeros_to_line(x_vals, y_vals):
 
 
 def model_plot_mean_abs_shap_values(
-    result,
+    variable_names,
+    variable_values,
+    shap_values,
+    aggregated_change,
     timestamps,
     event_inds,
     event_times,
@@ -50,18 +49,13 @@ def model_plot_mean_abs_shap_values(
     title=None,
     show=True,
 ):
-    df_prepared_to_plot = result.copy()
+    # mean absolute shap values of shape (n_variables, n_timestamps)
     if kind == "ratio":
-        df_prepared_to_plot.iloc[:, 5:] = df_prepared_to_plot.iloc[:, 5:] / df_prepared_to_plot.iloc[:, 5:].abs().sum()
+        shap_values = shap_values / np.abs(shap_values).sum(axis=0)
     if variables is not None:
-        df_prepared_to_plot = df_prepared_to_plot[df_prepared_to_plot["variable_name"].isin(variables)]
+        selected = np.flatnonzero(np.isin(variable_names, variables))
     else:
-        df_prepared_to_plot = (
-            df_prepared_to_plot.sort_values("aggregated_change", ascending=False)
-            .iloc[:max_vars]
-            .reset_index(drop=True)
-            .copy()
-        )
+        selected = np.argsort(-aggregated_change, kind="stable")[:max_vars]
 
     fig = plotly.subplots.make_subplots(rows=2, cols=1, print_grid=False, shared_xaxes=True)
     max_y, min_y = -1, 1
@@ -84,9 +78,9 @@ def model_plot_mean_abs_shap_values(
     colors = ["#46bac2", "#ae2c87", "#ffa58c", "#8bdcbe", "#f05a71", "#FED61E", "#FED61E"]
     colors = itertools.cycle(colors)
 
-    for index, row in df_prepared_to_plot.iterrows():
-        y_vals = row[5:].values
-        varval = row["variable_value"]
+    for i in selected:
+        y_vals = shap_values[i]
+        varval = variable_values[i]
         fig.add_trace(
             plotly.graph_objs.Scatter(
                 x=timestamps,
@@ -95,7 +89,7 @@ def model_plot_mean_abs_shap_values(
                 line_color=next(colors),
                 line_width=2,
                 hovertemplate="<b>"
-                + str(row["variable_name"])
+                + str(variable_names[i])
                 + "</b><br>"
                 + f"(Avg) variable value: {varval:.6f}"
                 + "<br>"
@@ -243,7 +237,8 @@ def model_plot_mean_abs_shap_values(
 
 
 def model_plot_shap_lines_for_all_individuals(
-    full_result,
+    shap_values,
+    variable_values,
     timestamps,
     event_inds,
     event_times,
@@ -256,13 +251,10 @@ def model_plot_shap_lines_for_all_individuals(
     show=True,
     title=None,
 ):
-    if variable not in full_result["variable_name"].unique():
-        raise ValueError("Variable not in the result")
-    df_prepared_to_plot = full_result[full_result["variable_name"] == variable]
-    df_prepared_to_plot = df_prepared_to_plot[df_prepared_to_plot["B"] == 0]
+    # shap values of the variable for all observations, of shape (n_observations, n_timestamps)
+    boxplot_data = shap_values
     if kind == "ratio":
-        df_prepared_to_plot.iloc[:, 6:] = df_prepared_to_plot.iloc[:, 6:] / df_prepared_to_plot.iloc[:, 6:].abs().sum()
-    df_prepared_to_plot = df_prepared_to_plot.reset_index(drop=True)
+        shap_values = shap_values / np.abs(shap_values).sum(axis=0)
     if ~boxplot:
         cmap = LinearSegmentedColormap.from_list(
             "dalex",
@@ -280,13 +272,12 @@ def model_plot_shap_lines_for_all_individuals(
             ],
             N=100,
         )
-        minima = np.min(df_prepared_to_plot["variable_value"])
-        maxima = np.max(df_prepared_to_plot["variable_value"])
+        minima = np.min(variable_values)
+        maxima = np.max(variable_values)
         norm = matplotlib.colors.Normalize(vmin=minima, vmax=maxima, clip=True)
         mapper = cm.ScalarMappable(norm=norm, cmap=cmap)
-        mapped = mapper.to_rgba(df_prepared_to_plot["variable_value"])
+        mapped = mapper.to_rgba(variable_values)
         mapped = np.apply_along_axis(lambda x: matplotlib.colors.rgb2hex(x[:3]), 1, mapped)
-        df_prepared_to_plot["index"] = mapped
 
     fig = plotly.subplots.make_subplots(rows=2, cols=1, print_grid=False, shared_xaxes=True)
 
@@ -300,10 +291,10 @@ def model_plot_shap_lines_for_all_individuals(
             median_idx,
             upper_whisker,
             lower_whisker,
-        ) = create_boxplot_with_outliers(variable, full_result, wfactor)
-    for i, row in df_prepared_to_plot.iterrows():
+        ) = create_boxplot_with_outliers(boxplot_data, wfactor)
+    for i in range(len(shap_values)):
         x_vals = timestamps
-        y_vals = row[6:].values
+        y_vals = shap_values[i]
         new_x, new_y = insert_zeros_to_line(x_vals, y_vals)
         if boxplot:
             if i in outliers_ids:
@@ -316,7 +307,7 @@ def model_plot_shap_lines_for_all_individuals(
                 line_color = "lightgrey"
                 line_width = 0.5
         else:
-            line_color = row["index"]
+            line_color = mapped[i]
             line_width = 0.5
         fig.add_trace(
             plotly.graph_objs.Scatter(
@@ -326,10 +317,10 @@ def model_plot_shap_lines_for_all_individuals(
                 line_color=line_color,
                 line_width=line_width,
                 hovertemplate="<b>"
-                + str(row["variable_name"])
+                + str(variable)
                 + "</b><br>"
                 + "Variable value: "
-                + str(row["variable_value"])
+                + str(variable_values[i])
                 + "<br>"
                 "Time: %{x}<br>" + keyword + "%{y:.6f}<extra></extra>",
                 hoverinfo="text",
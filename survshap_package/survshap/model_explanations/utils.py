@@ -1,13 +1,22 @@
+import itertools
 import numpy as np
 import pandas as pd
 
-from ..predict_explanations.utils import prepare_result_df
+from ..predict_explanations.utils import (
+    make_result,
+    shap_background_data,
+    shap_kernel_multiple,
+    shap_values_to_array,
+)
 from ..predict_explanations.object import PredictSurvSHAP
+from ..result import SurvSHAPResult
+from ..treeshap import tree_shap_values
+from .parallel import map_observation_chunks
+from joblib import effective_n_jobs
 from tqdm import tqdm
 import matplotlib.pyplot as plt
 from statsmodels.graphics.functional import fboxplot
 from scipy.integrate import trapezoid
-from sksurv.ensemble import RandomSurvivalForest
 import shap
 import warnings
 
@@ -24,119 +33,189 @@ def calculate_individual_explanations(
     aggregation_method,
     timestamps,
     save_individual_explanations,
+    n_jobs=None,
     **kwargs,
 ):
     individual_explanations = []
-    concatenated_results = pd.DataFrame()
-    preds = explainer.predict(explainer.data, function_type)
+    timestamps = explainer.resolve_timestamps(function_type, timestamps)
+    n_workers = min(effective_n_jobs(n_jobs), len(new_observations))
 
-    if timestamps is None:
-        timestamps = preds[0].x
-        preds = [f.y for f in preds]
-    else:
-        if calculation_method == "treeshap":
-            if not isinstance(explainer.model, RandomSurvivalForest):
-                raise TypeError("explained model must be of class sksurv.ensemble.RandomSurvivalForest")
-            warnings.warn(
-                "timestamps are ignored for calculation_method = 'treeshap' \n SurvSHAP(t) values are calculated for explainer.model.unique_times_"
-            )
-            timestamps = explainer.model.unique_times_
-            preds = [f.y for f in preds]
-        else:
-            preds = [f(timestamps) for f in preds]
+    if calculation_method in ["kernel", "shap_kernel", "treeshap"]:
+        preds = r2 = None
+        if calculation_method == "kernel":
+            if n_workers > 1 and random_state is None:
+                # with random_state=None a seed is drawn once, so that all workers use the same coalitions
+                # of the approximate kernel, as a single process does
+                random_state = int(np.random.SeedSequence().generate_state(1)[0])
+            args = (function_type, timestamps, max_shap_value_inputs, random_state)
+            if n_workers > 1:
+                parts = list(
+                    map_observation_chunks(
+                        explainer, new_observations, kernel_explanations, args, function_type, timestamps, n_workers
+                    )
+                )
+                shap_values, preds, r2 = (np.concatenate(arrays) for arrays in zip(*parts))
+            else:
+                shap_values, preds, r2 = kernel_explanations(explainer, new_observations, *args)
 
-    baseline_f = np.mean(preds, axis=0)
-
-    if calculation_method in ["shap_kernel", "treeshap"]:
-        if calculation_method == "shap_kernel":
+        elif calculation_method == "shap_kernel":
 
             def predict_function(X):
-                all_functions = explainer.predict(X, function_type)
-                preds = np.array([f(timestamps) for f in all_functions])
-                return preds
+                return explainer.predict_array(
+                    pd.DataFrame(X, columns=explainer.data.columns), function_type, timestamps
+                )
 
             # as shap convert pd.DataFrame to np.array
             with warnings.catch_warnings():
                 warnings.simplefilter("ignore", category=UserWarning)
-                exp = shap.KernelExplainer(predict_function, explainer.data, **kwargs)
+                exp = shap.KernelExplainer(predict_function, shap_background_data(explainer), **kwargs)
                 res = exp.shap_values(new_observations)
-            tmp = np.dstack(res).flatten()
+            shap_values = shap_values_to_array(res)
 
         elif calculation_method == "treeshap":
-            if function_type == "sf":
-                start_index = 1
-            elif function_type == "chf":
-                start_index = 0
-
-            n_estimators = len(explainer.model.estimators_)
-            tree_ensemble_model = {"trees": [estimator.tree_ for estimator in explainer.model.estimators_]}
-
-            with warnings.catch_warnings():
-                warnings.simplefilter("ignore", category=UserWarning)
-                exp = shap.TreeExplainer(tree_ensemble_model, explainer.data, **kwargs)
-                res = exp.shap_values(new_observations, **kwargs)
-            res = res[start_index::2]
-            tmp = np.dstack(res).flatten() / n_estimators
-
-        new_observations_shape = new_observations.shape
-        tmp = tmp.reshape(new_observations_shape[0] * new_observations_shape[1], len(timestamps))
-        variable_names = explainer.data.columns
-
-        exp_y_names = explainer.y.dtype.names
-        event_inds = explainer.y[exp_y_names[0]]
-        event_times = explainer.y[exp_y_names[1]]
-
-        for i in range(new_observations_shape[0]):
-            survSHAP_obj = PredictSurvSHAP(
-                function_type=function_type,
-                calculation_method=calculation_method,
-                aggregation_method=aggregation_method,
-                random_state=random_state,
-            )
-            survSHAP_obj.result = prepare_result_df(
-                new_observations.iloc[[i]],
-                variable_names,
-                tmp[(new_observations_shape[1] * i) : (new_observations_shape[1] * (i + 1)), :],
-                timestamps,
-                aggregation_method,
-            )
-            survSHAP_obj.simplified_result = survSHAP_obj.result[survSHAP_obj.result["B"] == 0].iloc[:, 1:5]
-            survSHAP_obj.predicted_function = preds[i]
-            survSHAP_obj.baseline_function = baseline_f
-            survSHAP_obj.timestamps = timestamps
+            shap_values = tree_shap_values(explainer, new_observations, function_type, timestamps, **kwargs)
 
-            survSHAP_obj.event_inds = event_inds
-            survSHAP_obj.event_times = event_times
+        result = make_result(explainer, new_observations, shap_values, timestamps, aggregation_method)
+        if not save_individual_explanations:
+            return result, individual_explanations, timestamps
 
-            if save_individual_explanations:
-                individual_explanations.append(survSHAP_obj)
-            tmp_results = survSHAP_obj.result
-            tmp_results.insert(5, "index", i)
-            concatenated_results = pd.concat((concatenated_results, tmp_results), axis=0)
+        individual_explanations = make_individual_explanations(
+            explainer,
+            new_observations,
+            result,
+            function_type,
+            calculation_method,
+            aggregation_method,
+            max_shap_value_inputs,
+            random_state,
+            preds,
+            r2,
+        )
     else:
-        for i in tqdm(range(len(new_observations))):
-            survSHAP_obj = PredictSurvSHAP(
-                function_type=function_type,
-                path=path,
-                B=B,
-                max_shap_value_inputs=max_shap_value_inputs,
-                calculation_method=calculation_method,
-                aggregation_method=aggregation_method,
-                random_state=random_state,
+        args = (function_type, path, B, max_shap_value_inputs, random_state, aggregation_method, timestamps)
+        if n_workers > 1:
+            explanations = itertools.chain.from_iterable(
+                map_observation_chunks(
+                    explainer, new_observations, sampling_explanations, args, function_type, timestamps, n_workers
+                )
             )
-            survSHAP_obj.fit(explainer, new_observations.iloc[[i]], timestamps)
+        else:
+            explanations = sampling_explanations(explainer, new_observations, *args)
+
+        exp_y_names = explainer.y.dtype.names
+        values = orders = path_ids = None
+        for i, survSHAP_obj in enumerate(tqdm(explanations, total=len(new_observations))):
+            survSHAP_obj.event_inds = explainer.y[exp_y_names[0]]
+            survSHAP_obj.event_times = explainer.y[exp_y_names[1]]
+            observation_result = survSHAP_obj.survshap_result
+            if values is None:
+                # all observations have the same paths, so blocks of every observation are written into one array
+                values = np.empty((len(new_observations),) + observation_result.values.shape[1:])
+                orders = np.empty((len(new_observations),) + observation_result.orders.shape[1:], dtype=int)
+                path_ids = observation_result.path_ids
+            values[i] = observation_result.values[0]
+            orders[i] = observation_result.orders[0]
             if save_individual_explanations:
                 individual_explanations.append(survSHAP_obj)
-            tmp_results = survSHAP_obj.result
-            tmp_results.insert(5, "index", i)
-            concatenated_results = pd.concat((concatenated_results, tmp_results), axis=0)
-    if timestamps is None:
-        timestamps = survSHAP_obj.timestamps
-    return concatenated_results, individual_explanations, timestamps
+        result = SurvSHAPResult(
+            values,
+            explainer.data.columns,
+            new_observations.to_numpy(),
+            timestamps,
+            aggregation_method,
+            path_ids,
+            orders,
+        )
+        for i, survSHAP_obj in enumerate(individual_explanations):
+            survSHAP_obj.survshap_result = result.observation(i)
+    return result, individual_explanations, timestamps
 
 
-def create_boxplot_with_outliers(variable, full_result, wfactor=3):
-    boxplot_data = full_result[(full_result["variable_name"] == variable) & (full_result["B"] == 0)].iloc[:, 6:].values
+def make_individual_explanations(
+    explainer,
+    new_observations,
+    result,
+    function_type,
+    calculation_method,
+    aggregation_method,
+    max_shap_value_inputs,
+    random_state,
+    preds=None,
+    r2=None,
+):
+    # individual explanations share the arrays of the batched result
+    timestamps = result.timestamps
+    if preds is None:
+        preds = explainer.predict_array(new_observations, function_type, timestamps)
+    baseline_f = explainer.baseline_function(function_type, timestamps)
+    exp_y_names = explainer.y.dtype.names
+    event_inds = explainer.y[exp_y_names[0]]
+    event_times = explainer.y[exp_y_names[1]]
+
+    individual_explanations = []
+    for i in range(len(new_observations)):
+        survSHAP_obj = PredictSurvSHAP(
+            function_type=function_type,
+            calculation_method=calculation_method,
+            aggregation_method=aggregation_method,
+            max_shap_value_inputs=max_shap_value_inputs,
+            random_state=random_state,
+        )
+        survSHAP_obj.survshap_result = result.observation(i)
+        survSHAP_obj.predicted_function = preds[i]
+        survSHAP_obj.baseline_function = baseline_f
+        survSHAP_obj.timestamps = timestamps
+        if r2 is not None:
+            survSHAP_obj.r2 = r2[i]
+
+        survSHAP_obj.event_inds = event_inds
+        survSHAP_obj.event_times = event_times
+        individual_explanations.append(survSHAP_obj)
+    return individual_explanations
+
+
+def kernel_explanations(explainer, new_observations, function_type, timestamps, max_shap_value_inputs, random_state):
+    shap_values, preds, _, _, r2 = shap_kernel_multiple(
+        explainer,
+        new_observations,
+        function_type,
+        timestamps,
+        max_shap_value_inputs,
+        random_state,
+    )
+    return shap_values, preds, r2
+
+
+def sampling_explanations(
+    explainer,
+    new_observations,
+    function_type,
+    path,
+    B,
+    max_shap_value_inputs,
+    random_state,
+    aggregation_method,
+    timestamps,
+):
+    for i in range(len(new_observations)):
+        survSHAP_obj = PredictSurvSHAP(
+            function_type=function_type,
+            path=path,
+            B=B,
+            max_shap_value_inputs=max_shap_value_inputs,
+            calculation_method="sampling",
+            aggregation_method=aggregation_method,
+            random_state=random_state,
+        )
+        survSHAP_obj.fit(explainer, new_observations.iloc[[i]], timestamps)
+        # do not keep coalition caches of all observations alive, and do not send the full y back from workers
+        survSHAP_obj._sampling_state = None
+        survSHAP_obj.event_inds = None
+        survSHAP_obj.event_times = None
+        yield survSHAP_obj
+
+
+def create_boxplot_with_outliers(boxplot_data, wfactor=3):
     fbxplt = fboxplot(boxplot_data, wfactor=wfactor)
     plt.close()
     outliers_ids = fbxplt[3]
@@ -149,13 +228,34 @@ def create_boxplot_with_outliers(variable, full_result, wfactor=3):
 
 def aggregate_change(average_changes, aggregation_method, timestamps):
     if aggregation_method == "sum_of_squares":
-        return np.sum(average_changes**2, axis=1)
+        return np.sum(average_changes**2, axis=-1)
     if aggregation_method == "max":
-        return np.max(average_changes, axis=1)
+        return np.max(average_changes, axis=-1)
     if aggregation_method == "mean":
-        return np.mean(average_changes, axis=1)
+        return np.mean(average_changes, axis=-1)
     if aggregation_method == "integral":
-        return trapezoid(average_changes.values, timestamps)
+        return trapezoid(average_changes, timestamps)
+
+
+def make_mean_abs_shap_values_frame(statistics, aggregation_method):
+    mean_abs_shap_values = statistics.mean_abs_shap_values()
+    result = pd.concat(
+        [
+            pd.DataFrame(
+                {
+                    "variable_name": statistics.variable_names,
+                    "variable_value": statistics.mean_abs_variable_values(),
+                    "B": 0,
+                    "aggregated_change": aggregate_change(mean_abs_shap_values, aggregation_method, statistics.timestamps),
+                    # mean of the "index" column of full_result, kept so that the columns are laid out as before
+                    "index": (statistics.n_observations - 1) / 2,
+                }
+            ),
+            pd.DataFrame(mean_abs_shap_values, columns=[" = ".join(["t", str(time)]) for time in statistics.timestamps]),
+        ],
+        axis=1,
+    )
+    return result.sort_values("aggregated_change", ascending=False)
 
 
 def calculate_risk_table(ticks, times, event_ind):
@@ -1,8 +1,15 @@
 from .plot import predict_plot
-import pandas as pd
 import numpy as np
 import pandas as pd
-from .utils import check_new_observation, shap_kernel, shap_sampling, shap_kernel_explainer, shap_tree_explainer
+from .utils import (
+    check_new_observation,
+    shap_kernel,
+    shap_sampling,
+    refine_shap_sampling,
+    shap_kernel_explainer,
+    shap_tree_explainer,
+)
+from ..session import SurvSHAPSession
 
 
 class PredictSurvSHAP:
@@ -16,25 +23,31 @@ class PredictSurvSHAP:
         max_shap_value_inputs=np.inf,
         random_state=None,
         exact=False,
+        n_jobs=None,
+        tol=None,
+        path_sampling="random",
     ):
         """Constructor for class PredictSurvSHAP
 
         Args:
             function_type (str, optional): Either "sf" representing survival function or "chf" representing cumulative hazard function. Type of function to be evaluated for explanation. Defaults to "sf".
-            calculation_method (str, optional): Chooses the method for SurvSHAP(t) calculation. "shap_kernel" for shap.KernelExplainer, "kernel" for exact KernelSHAP, "sampling" for sampling method, or "treeshap" for shap.TreeExplainer. Defaults to "kernel".
+            calculation_method (str, optional): Chooses the method for SurvSHAP(t) calculation. "shap_kernel" for shap.KernelExplainer, "kernel" for exact KernelSHAP, "sampling" for sampling method, or "treeshap" for interventional TreeSHAP of sksurv tree ensembles (RandomSurvivalForest, ExtraSurvivalTrees or GradientBoostingSurvivalAnalysis with loss="coxph"; for gradient boosting the values are an approximation, TreeSHAP values of the log-risk rescaled to the function). Defaults to "kernel".
             aggregation_method (str, optional): One of "sum_of_squares", "max_abs", "mean_abs" or "integral". Type of method  Defaults to "integral".
             path (list of int or str, optional): If specified, then attributions for this path will be plotted. Defaults to "average".
             B (int, optional): Number of random paths to calculate variable attributions. Defaults to 25.
             max_shap_value_inputs (int, optional): Maximum number of simplified inputs to be used for SurvSHAP(t) calculation. Defaults to np.inf (no limit). Lower values can be used to speed up calculation.
             random_state (int, optional): Set seed for random number generator. Defaults to None.
-            exact (bool, optional): Calculates all paths. If this is set to True parameter B is overriden. Defaults to False.
+            exact (bool, optional): Calculates the average over all paths exactly, from the values of all 2**p coalitions. If this is set to True parameter B is overriden and results for individual paths are not included. Defaults to False.
+            n_jobs (int, optional): Number of parallel jobs used to evaluate random paths with calculation_method="sampling". Every path uses its own random generator derived from `random_state`, so results do not depend on `n_jobs`. Defaults to None (1 job).
+            tol (float, optional): If set, random paths with calculation_method="sampling" are added in rounds until the standard error of the aggregated change (calculated with `aggregation_method` from standard error curves) is at most `tol` for every variable. `B` is then the maximum number of paths. Rounds consist of whole pairs of paths for path_sampling="antithetic" and whole blocks of `p` paths for "stratified", whose standard errors are calculated from pair or block means. Defaults to None (exactly `B` paths).
+            path_sampling (str, optional): Generator of paths for calculation_method="sampling". One of "random" (independent random permutations), "antithetic" (every second path is the reverse of the previous one) or "stratified" (blocks of `p` paths in which every variable takes every position once). Defaults to "random".
         """
         self.function = function_type
         self.calculation_method = calculation_method
         self.aggregation_method = aggregation_method
         self.path = path
         self.B = B
-        self.result = pd.DataFrame()
+        self.survshap_result = None
         self.timestamps = None
         self.predicted_function = None
         self.baseline_function = None
@@ -47,6 +60,48 @@ class PredictSurvSHAP:
         self.y_true_ind = None  # for this instance
         self.r2 = None
         self.max_shap_value_inputs = max_shap_value_inputs
+        self.n_jobs = n_jobs
+        self.tol = tol
+        self.path_sampling = path_sampling
+        self.standard_errors = None
+        self._sampling_state = None
+
+    @property
+    def survshap_result(self):
+        return self._survshap_result
+
+    @survshap_result.setter
+    def survshap_result(self, value):
+        # DataFrame views are built from the array-backed result only when they are used
+        self._survshap_result = value
+        self._result = None
+        self._simplified_result = None
+
+    @property
+    def result(self):
+        if self._result is None:
+            self._result = pd.DataFrame() if self.survshap_result is None else self.survshap_result.to_frame()
+        return self._result
+
+    @result.setter
+    def result(self, value):
+        # an assigned frame is kept until a new explanation is calculated
+        self._result = value
+
+    @property
+    def simplified_result(self):
+        if self._simplified_result is None:
+            if self.survshap_result is None:
+                self._simplified_result = pd.DataFrame()
+            else:
+                self._simplified_result = self.survshap_result.to_frame(explanation_only=True).loc[
+                    :, ["variable_name", "variable_value", "B", "aggregated_change"]
+                ]
+        return self._simplified_result
+
+    @simplified_result.setter
+    def simplified_result(self, value):
+        self._simplified_result = value
 
     def _repr_html_(self):
         return self.simplified_result._repr_html_()
@@ -55,14 +110,21 @@ class PredictSurvSHAP:
         """Calculate SurvSHAP(t) for an observation
 
         Args:
-            explainer (SurvivalModelExplainer): A wrapper object for the model to be explained.
+            explainer (SurvivalModelExplainer or SurvSHAPSession): A wrapper object for the model to be explained, or a session of such an object whose backends are reused.
             new_observation (pandas.DataFrame): A DataFrame with a single row, containing the observation to be explained.
-            timestamps (numpy.Array, optional): An array of timestamps at which SurvSHAP(t) values should be calculated. Defaults to None.
+            timestamps (numpy.Array or str, optional): An array of timestamps at which SurvSHAP(t) values should be calculated, or one of "quantiles", "knots" or "tolerance" to choose a reduced grid automatically (see `SurvivalModelExplainer.select_timestamps`). Defaults to None (timestamps of the session if `explainer` is a session).
             y_true (pandas.DataFrame, optional): A DataFrame containing the observed time and status of the explained observation. Used for plotting. Defaults to None.
 
         Raises:
-            ValueError: if calculation_method is invalid
+            ValueError: if calculation_method is invalid, or function_type or timestamps differ from those of the session
         """
+        kernel_explainer = None
+        if isinstance(explainer, SurvSHAPSession):
+            session = explainer
+            explainer = session.explainer
+            timestamps = session.resolve_timestamps(self.function, timestamps)
+            if self.calculation_method == "shap_kernel":
+                kernel_explainer = session.kernel_explainer()
         new_observation = check_new_observation(new_observation, explainer)
         names = explainer.y.dtype.names
         self.event_inds = explainer.y[names[0]]
@@ -73,7 +135,7 @@ class PredictSurvSHAP:
 
         if self.calculation_method == "kernel":
             (
-                self.result,
+                self.survshap_result,
                 self.predicted_function,
                 self.baseline_function,
                 self.timestamps,
@@ -85,13 +147,16 @@ class PredictSurvSHAP:
                 self.aggregation_method,
                 timestamps,
                 self.max_shap_value_inputs,
+                self.random_state,
             )
         elif self.calculation_method == "sampling":
             (
-                self.result,
+                self.survshap_result,
                 self.predicted_function,
                 self.baseline_function,
                 self.timestamps,
+                self.standard_errors,
+                self._sampling_state,
             ) = shap_sampling(
                 explainer,
                 new_observation,
@@ -102,10 +167,13 @@ class PredictSurvSHAP:
                 self.aggregation_method,
                 timestamps,
                 self.exact,
+                self.n_jobs,
+                self.tol,
+                self.path_sampling,
             )
         elif self.calculation_method == "shap_kernel":
             (
-                self.result,
+                self.survshap_result,
                 self.predicted_function,
                 self.baseline_function,
                 self.timestamps,
@@ -115,10 +183,11 @@ class PredictSurvSHAP:
                 self.function,
                 self.aggregation_method,
                 timestamps,
+                kernel_explainer,
             )
         elif self.calculation_method == "treeshap":
             (
-                self.result,
+                self.survshap_result,
                 self.predicted_function,
                 self.baseline_function,
                 self.timestamps,
@@ -128,12 +197,25 @@ class PredictSurvSHAP:
                 self.function,
                 self.aggregation_method,
                 timestamps,
-                treeshap=True,
             )
         else:
             raise ValueError("calculation_method should be 'kernel', 'sampling', 'shap_kernel', or 'treeshap'")
 
-        self.simplified_result = self.result[self.result["B"] == 0].iloc[:, 1:5]
+    def refine(self, extra_B, tol=None):
+        """Add random paths to an explanation calculated with calculation_method="sampling"
+
+        Paths calculated before are not recomputed, and coalitions evaluated before are not predicted again.
+
+        Args:
+            extra_B (int): Maximum number of random paths to add.
+            tol (float, optional): If set, stop adding paths once the standard error of every aggregated change is at most `tol`. Defaults to None (exactly `extra_B` paths are added).
+
+        Raises:
+            ValueError: if the explanation was not calculated with the sampling method and exact=False
+        """
+        if self._sampling_state is None:
+            raise ValueError("refine is available only after fit with calculation_method='sampling' and exact=False")
+        self.survshap_result, self.standard_errors = refine_shap_sampling(self._sampling_state, extra_B, tol)
 
     def plot(
         self,
@@ -168,8 +250,12 @@ class PredictSurvSHAP:
             plotly.graph_objects.Figure: If show is `False` then a plotly Figure is returned.
         """
 
+        variable_names, variable_values, shap_values, aggregated_change = self.survshap_result.explanation_rows()
         return predict_plot(
-            self.result,
+            variable_names,
+            variable_values,
+            shap_values,
+            aggregated_change,
             self.predicted_function,
             self.baseline_function,
             self.timestamps,
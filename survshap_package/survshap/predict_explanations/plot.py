@@ -6,8 +6,8 @@ import itertools
 from .utils import calculate_risk_table
 
 
-def tooltip_text(row):
-    return f"<b>{row.variable_name}</b><br>" + f"Value: {float(row.variable_value):.6g}<br>"
+def tooltip_text(variable_name, variable_value):
+    return f"<b>{variable_name}</b><br>" + f"Value: {float(variable_value):.6g}<br>"
 
 
 def check_y_range(max_y, min_y, new_vector):
@@ -39,7 +39,10 @@ def insert_zeros_to_line(x_vals, y_vals, baseline_function):
 
 
 def predict_plot(
-    result,
+    variable_names,
+    variable_values,
+    shap_values,
+    aggregated_change,
     predicted_function,
     baseline_function,
     timestamps,
@@ -59,28 +62,18 @@ def predict_plot(
     title=None,
     show=True,
 ):
-    # get averaged shap values
-    final_result = result[result["B"] == 0]
+    # shap values of the explained rows, of shape (n_variables, n_timestamps)
     if kind == "ratio":
-        final_result.iloc[:, 5:] = np.nan_to_num(
-            final_result[final_result["B"] == 0].iloc[:, 5:]
-            / final_result[final_result["B"] == 0].iloc[:, 5:].abs().sum()
-        )
+        with np.errstate(divide="ignore", invalid="ignore"):
+            shap_values = np.nan_to_num(shap_values / np.abs(shap_values).sum(axis=0))
         add_to_baseline = False
         show_prediction = False
         show_overall_change = False
 
     # choose variables
-    if variables is not None:
-        df_prepared_to_plot = final_result[final_result["variable_name"].isin(variables)].copy()
-    else:
-        variables = (
-            final_result.sort_values("aggregated_change", key=abs, ascending=False).iloc[:max_vars].variable_name
-        )
-        df_prepared_to_plot = final_result[final_result["variable_name"].isin(variables)].copy()
-
-    # add tooltips
-    df_prepared_to_plot["tooltip_text"] = df_prepared_to_plot.apply(lambda row: tooltip_text(row), axis=1)
+    if variables is None:
+        variables = variable_names[np.argsort(-np.abs(aggregated_change), kind="stable")[:max_vars]]
+    selected = np.flatnonzero(np.isin(variable_names, variables))
 
     fig = plotly.subplots.make_subplots(rows=2, cols=1, print_grid=False, shared_xaxes=True)
 
@@ -121,7 +114,6 @@ def predict_plot(
             col=1,
         )
 
-    start_idx_preds = np.where(df_prepared_to_plot.columns == f"t = {timestamps[0]}")[0][0]
     keyword = "SF value: " if add_to_baseline else "SHAP value: " if kind == "default" else "normalized SHAP value: "
 
     # SurvSHAP(t) curves for different variables
@@ -130,9 +122,9 @@ def predict_plot(
     colors = ["#46bac2", "#ae2c87", "#ffa58c", "#8bdcbe", "#f05a71", "#FED61E", "#FED61E"]
     colors = itertools.cycle(colors)
 
-    for index, row in df_prepared_to_plot.iterrows():
+    for i in selected:
         x_vals = timestamps
-        y_vals = row[start_idx_preds:-1].values
+        y_vals = shap_values[i]
 
         fig.add_trace(
             plotly.graph_objs.Scatter(
@@ -140,15 +132,13 @@ def predict_plot(
                 y=y_vals + baseline_function if add_to_baseline else y_vals,
                 mode="lines",
                 line_color=next(colors),
-                hovertemplate=row["tooltip_text"] + "Time: %{x}<br>" + keyword + "%{y:.6f}<extra></extra>",
+                hovertemplate=tooltip_text(variable_names[i], variable_values[i]) + "Time: %{x}<br>" + keyword + "%{y:.6f}<extra></extra>",
                 hoverinfo="text",
             ),
             row=1,
             col=1,
         )
-        new_vector = (
-            row[start_idx_preds:-1].values + baseline_function if add_to_baseline else row[start_idx_preds:-1].values
-        )
+        new_vector = y_vals + baseline_function if add_to_baseline else y_vals
         max_y, min_y = check_y_range(max_y, min_y, new_vector)
 
     if add_to_baseline and show_prediction:
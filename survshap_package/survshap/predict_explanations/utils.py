@@ -1,173 +1,326 @@
 from copy import deepcopy
+from functools import lru_cache
 import itertools
 import numpy as np
 import pandas as pd
 from tqdm import tqdm
 import math
-from scipy.integrate import trapezoid
-from sklearn.metrics import r2_score
-from sksurv.ensemble import RandomSurvivalForest
+from numpy.linalg import LinAlgError
+from scipy.linalg import cho_factor, cho_solve
+from joblib import Parallel, delayed, effective_n_jobs
 import shap
 import warnings
+from ..result import SurvSHAPResult, aggregate_change
+from ..treeshap import tree_shap_values
+from ..evaluators import select_coalition_evaluator
 
 
 def shap_tree_explainer(explainer, new_observation, function_type, aggregation_method, timestamps, **kwargs):
-    if timestamps is not None:
-        warnings.warn(
-            "timestamps are ignored for calculation_method = 'treeshap' \n SurvSHAP(t) values are calculated for explainer.model.unique_times_"
-        )
-    timestamps = explainer.model.unique_times_
-
-    if not isinstance(explainer.model, RandomSurvivalForest):
-        raise TypeError("explained model must be of class sksurv.ensemble.RandomSurvivalForest")
-
-    if function_type == "sf":
-        start_index = 1
-    elif function_type == "chf":
-        start_index = 0
+    target_fun, baseline_fun, timestamps = prepare_functions(explainer, new_observation, function_type, timestamps)
+    shap_values = tree_shap_values(explainer, new_observation, function_type, timestamps, **kwargs)
+    result = make_result(explainer, new_observation, shap_values, timestamps, aggregation_method)
+    return result, target_fun, baseline_fun, timestamps
 
-    all_function_vals = [f.y for f in explainer.predict(explainer.data, function_type)]
-    baseline_fun = np.mean(all_function_vals, axis=0)
-    target_fun = explainer.predict(new_observation, function_type)[0].y
 
-    n_estimators = len(explainer.model.estimators_)
-    tree_ensemble_model = {"trees": [estimator.tree_ for estimator in explainer.model.estimators_]}
+def shap_kernel_explainer(
+    explainer, new_observation, function_type, aggregation_method, timestamps, kernel_explainer=None, **kwargs
+):
+    target_fun, baseline_fun, timestamps = prepare_functions(explainer, new_observation, function_type, timestamps)
+    if kernel_explainer is None:
+        kernel_explainer = make_shap_kernel_explainer(explainer, function_type, timestamps, **kwargs)
 
+    # as shap convert pd.DataFrame to np.array
     with warnings.catch_warnings():
         warnings.simplefilter("ignore", category=UserWarning)
-        exp = shap.TreeExplainer(tree_ensemble_model, explainer.data, **kwargs)
-        res = exp.shap_values(new_observation)
+        res = kernel_explainer.shap_values(new_observation)
 
-    shap_values = np.vstack(res[start_index::2]).T / n_estimators
+    shap_values = shap_values_to_array(res)
 
-    variable_names = explainer.data.columns
-    result = prepare_result_df(new_observation, variable_names, shap_values, timestamps, aggregation_method)
+    result = make_result(explainer, new_observation, shap_values, timestamps, aggregation_method)
     return result, target_fun, baseline_fun, timestamps
 
 
-def shap_kernel_explainer(explainer, new_observation, function_type, aggregation_method, timestamps, **kwargs):
-    target_fun = explainer.predict(new_observation, function_type)[0]
-    all_functions = explainer.predict(explainer.data, function_type)
-
-    if timestamps is None:
-        target_fun = target_fun.y
-        all_functions_vals = [f.y for f in all_functions]
-        timestamps = all_functions[0].x
-    else:
-        target_fun = target_fun(timestamps)
-        all_functions_vals = [f(timestamps) for f in all_functions]
-    baseline_fun = np.mean(all_functions_vals, axis=0)
-
+def make_shap_kernel_explainer(explainer, function_type, timestamps, **kwargs):
+    # predicts the background data once, so it is reused for many observations
     def predict_function(X):
-        all_functions = explainer.predict(X, function_type)
-        preds = np.array([f(timestamps) for f in all_functions])
-        return preds
+        return explainer.predict_array(pd.DataFrame(X, columns=explainer.data.columns), function_type, timestamps)
 
-    # as shap convert pd.DataFrame to np.array
     with warnings.catch_warnings():
         warnings.simplefilter("ignore", category=UserWarning)
-        exp = shap.KernelExplainer(predict_function, explainer.data, **kwargs)
-        res = exp.shap_values(new_observation)
-
-    shap_values = np.vstack(res).T
-
-    variable_names = explainer.data.columns
-    result = prepare_result_df(new_observation, variable_names, shap_values, timestamps, aggregation_method)
-    return result, target_fun, baseline_fun, timestamps
+        return shap.KernelExplainer(predict_function, shap_background_data(explainer), **kwargs)
+
+
+def shap_values_to_array(res):
+    # older shap versions return a list with one (N, p) array per output, newer ones a single (N, p, T) array
+    if isinstance(res, list):
+        return np.stack(res, axis=-1)
+    return np.asarray(res)
+
+
+def shap_background_data(explainer):
+    if explainer.background_weights is None:
+        return explainer.data
+    # shap.KernelExplainer accepts weights only with its private DenseData background type (the type returned by
+    # shap.kmeans), which has no public constructor; it is imported explicitly so that a change in shap fails here
+    try:
+        from shap.utils._legacy import DenseData
+    except ImportError:
+        raise ImportError(
+            "calculation_method='shap_kernel' with background_weights requires shap.utils._legacy.DenseData, "
+            "which is not available in the installed shap version; use calculation_method='kernel' or unset "
+            "background_weights"
+        )
+    return DenseData(explainer.data.to_numpy(), list(explainer.data.columns), None, explainer.background_weights.copy())
 
 
 def shap_kernel(
-    explainer, new_observation, function_type, aggregation_method, timestamps, max_shap_value_inputs=np.inf
+    explainer,
+    new_observation,
+    function_type,
+    aggregation_method,
+    timestamps,
+    max_shap_value_inputs=np.inf,
+    random_state=None,
 ):
-    p = new_observation.shape[1]
-
     # only one new_observation allowed
-    target_fun = explainer.predict(new_observation, function_type)[0]
-    all_functions = explainer.predict(explainer.data, function_type)
+    shap_values, target_funs, baseline_f, timestamps, r2 = shap_kernel_multiple(
+        explainer, new_observation, function_type, timestamps, max_shap_value_inputs, random_state
+    )
 
-    if timestamps is None:
-        target_fun = target_fun.y
-        all_functions_vals = [f.y for f in all_functions]
-        timestamps = all_functions[0].x
-    else:
-        target_fun = target_fun(timestamps)
-        all_functions_vals = [f(timestamps) for f in all_functions]
-    baseline_f = np.mean(all_functions_vals, axis=0)
+    result = make_result(explainer, new_observation, shap_values, timestamps, aggregation_method)
+    return result, target_funs[0], baseline_f, timestamps, r2[0]
 
-    if 2**p < max_shap_value_inputs:
-        simplified_inputs = [list(z) for z in itertools.product(range(2), repeat=p)]
-    else:
-        simplified_inputs = list(np.random.randint(0, 2, size=(max_shap_value_inputs, p)))
-        print(
-            f"Approximate Survival Shapley will sample only {max_shap_value_inputs} values instead of 2**{p} for Exact Shapley"
-        )
 
-    kernel_weights = generate_shap_kernel_weights(simplified_inputs, p)
-    shap_values, r2 = calculate_shap_values(
-        explainer,
-        function_type,
-        baseline_f,
-        explainer.data,
-        simplified_inputs,
-        kernel_weights,
-        new_observation,
-        timestamps,
+def shap_kernel_multiple(
+    explainer,
+    new_observations,
+    function_type,
+    timestamps,
+    max_shap_value_inputs=np.inf,
+    random_state=None,
+):
+    # all observations share one coalition design; returns SurvSHAP(t) values of shape (N, p, T)
+    n_observations, p = new_observations.shape
+    timestamps = explainer.resolve_timestamps(function_type, timestamps)
+    target_funs = explainer.predict_array(new_observations, function_type, timestamps)
+    baseline_f = explainer.baseline_function(function_type, timestamps)
+    solver = kernel_solver(p, max_shap_value_inputs, random_state)
+    n_coalitions = len(solver.simplified_inputs)
+
+    shap_values = np.zeros((n_observations, p, len(timestamps)))
+    r2 = np.zeros((n_observations, len(timestamps)))
+    # observations are processed in blocks so that coalition values of a block fit in about one prediction batch
+    block_size = max(1, explainer.batch_size // (n_coalitions * len(explainer.data)))
+    blocks = range(0, n_observations, block_size)
+    for start in tqdm(blocks, disable=len(blocks) == 1):
+        block = new_observations.iloc[start : start + block_size]
+        y = (
+            make_predictions_for_simplified_inputs(
+                explainer, function_type, explainer.data, solver.simplified_inputs, block, timestamps
+            )
+            - baseline_f
+        )
+        # (N, M, T) -> (M, N * T), so that all regressions are solved with a single matrix product
+        y = y.transpose(1, 0, 2).reshape(n_coalitions, -1)
+        block_shap_values, block_r2 = solver.solve(y)
+        shap_values[start : start + len(block)] = block_shap_values.reshape(p, len(block), -1).transpose(1, 0, 2)
+        r2[start : start + len(block)] = block_r2.reshape(len(block), -1)
+    return shap_values, target_funs, baseline_f, timestamps, r2
+
+
+def kernel_solver(num_variables, max_shap_value_inputs, random_state):
+    if 2**num_variables < max_shap_value_inputs:
+        return exact_kernel_solver(num_variables)
+    print(
+        f"Approximate Survival Shapley will sample only {max_shap_value_inputs} values instead of 2**{num_variables} for Exact Shapley"
     )
-
-    variable_names = explainer.data.columns
-    result = prepare_result_df(new_observation, variable_names, shap_values, timestamps, aggregation_method)
-    return result, target_fun, baseline_f, timestamps, r2
+    return sampled_kernel_solver(num_variables, max_shap_value_inputs, random_state)
 
 
 def generate_shap_kernel_weights(simplified_inputs, num_variables):
-    weights = []
-    for coalition_vector in simplified_inputs:
-        num_available_variables = np.count_nonzero(coalition_vector)
-        if num_available_variables == 0 or num_available_variables == num_variables:
-            weights.append(1e9)
-        else:
-            weights.append(
-                (num_variables - 1)
-                / (
-                    math.comb(num_variables, num_available_variables)
-                    * num_available_variables
-                    * (num_variables - num_available_variables)
-                )
-            )
-    return weights
+    num_available_variables = np.count_nonzero(simplified_inputs, axis=1)
+    size_weights = np.full(num_variables + 1, 1e9)
+    for size in range(1, num_variables):
+        size_weights[size] = (num_variables - 1) / (math.comb(num_variables, size) * size * (num_variables - size))
+    return size_weights[num_available_variables]
+
+
+@lru_cache(maxsize=8)
+def exact_kernel_solver(num_variables):
+    # all 2**p coalitions in itertools.product order; the design depends only on p
+    simplified_inputs = (np.arange(2**num_variables)[:, None] >> np.arange(num_variables - 1, -1, -1)) & 1
+    return KernelSHAPSolver(simplified_inputs, generate_shap_kernel_weights(simplified_inputs, num_variables))
+
+
+def sampled_kernel_solver(num_variables, num_samples, random_state):
+    if random_state is None:
+        return KernelSHAPSolver(*sample_kernel_coalitions(num_variables, num_samples, np.random.default_rng()))
+    return seeded_kernel_solver(num_variables, int(num_samples), random_state)
+
+
+@lru_cache(maxsize=8)
+def seeded_kernel_solver(num_variables, num_samples, random_state):
+    rng = np.random.default_rng(random_state)
+    return KernelSHAPSolver(*sample_kernel_coalitions(num_variables, num_samples, rng))
+
+
+def sample_kernel_coalitions(num_variables, num_samples, rng):
+    # coalition sizes with the largest kernel mass are enumerated fully, the remaining sizes are sampled
+    # in complementary pairs; repeated draws are merged into one coalition with a summed weight
+    p = num_variables
+    masks = [np.zeros(p, dtype=int), np.ones(p, dtype=int)]
+    weights = [1e9, 1e9]
+    num_samples_left = int(num_samples) - 2
+
+    num_subset_sizes = int(np.ceil((p - 1) / 2))
+    num_paired_subset_sizes = int(np.floor((p - 1) / 2))
+    sizes = np.arange(1, num_subset_sizes + 1)
+    size_mass = (p - 1) / (sizes * (p - sizes))
+    size_mass[:num_paired_subset_sizes] *= 2
+
+    num_full_subsets = 0
+    remaining_mass = size_mass / size_mass.sum() if num_subset_sizes > 0 else size_mass
+    for i, size in enumerate(sizes):
+        is_paired = i < num_paired_subset_sizes
+        num_subsets = math.comb(p, size) * (2 if is_paired else 1)
+        if num_samples_left * remaining_mass[i] / num_subsets < 1.0 - 1e-8:
+            break
+        weight = size_mass[i] / num_subsets
+        for subset in itertools.combinations(range(p), size):
+            mask = np.zeros(p, dtype=int)
+            mask[list(subset)] = 1
+            masks.append(mask)
+            weights.append(weight)
+            if is_paired:
+                masks.append(1 - mask)
+                weights.append(weight)
+        num_samples_left -= num_subsets
+        num_full_subsets += 1
+        if remaining_mass[i] < 1:
+            remaining_mass = remaining_mass / (1 - remaining_mass[i])
+
+    if num_samples_left > 0 and num_full_subsets < num_subset_sizes:
+        sampled_sizes = sizes[num_full_subsets:]
+        probabilities = size_mass[num_full_subsets:] / size_mass[num_full_subsets:].sum()
+        counts = {}
+        draws = 0
+        # a complementary pair takes two slots, a single slot is filled only by an unpaired size
+        min_slots = 1 if sampled_sizes[-1] > num_paired_subset_sizes else 2
+        while num_samples_left - len(counts) >= min_slots and draws < 4 * num_samples_left:
+            num_draws = num_samples_left - len(counts)
+            drawn_sizes = rng.choice(sampled_sizes, size=num_draws, p=probabilities)
+            positions = rng.random((num_draws, p)).argsort(axis=1).argsort(axis=1)
+            drawn_masks = (positions < drawn_sizes[:, None]).astype(int)
+            draws += num_draws
+            for size, mask in zip(drawn_sizes, drawn_masks):
+                # a mask and its complement are added and counted together
+                candidates = [mask, 1 - mask] if size <= num_paired_subset_sizes else [mask]
+                if mask.tobytes() in counts:
+                    for candidate in candidates:
+                        counts[candidate.tobytes()][1] += 1
+                elif len(counts) + len(candidates) <= num_samples_left:
+                    for candidate in candidates:
+                        counts[candidate.tobytes()] = [candidate, 1]
+        total_count = sum(count for _, count in counts.values())
+        for candidate, count in counts.values():
+            masks.append(candidate)
+            weights.append(size_mass[num_full_subsets:].sum() * count / total_count)
+
+    return np.array(masks), np.array(weights)
+
+
+class KernelSHAPSolver:
+    def __init__(self, simplified_inputs, kernel_weights):
+        """Weighted least squares solver for a fixed coalition design
+
+        The projection matrix depends only on the coalitions and their kernel weights,
+        so a single solver can be reused for every explained observation.
+
+        Args:
+            simplified_inputs (numpy.ndarray): Binary array of shape (n_coalitions, n_variables).
+            kernel_weights (numpy.ndarray): SHAP kernel weights of shape (n_coalitions,).
+        """
+        self.simplified_inputs = np.asarray(simplified_inputs)
+        self.kernel_weights = np.asarray(kernel_weights, dtype=float)
+        X = self.simplified_inputs.astype(float)
+        XtW = X.T * self.kernel_weights
+        try:
+            self.projection = cho_solve(cho_factor(XtW @ X), XtW)
+        except LinAlgError:
+            self.projection = np.linalg.lstsq(XtW @ X, XtW, rcond=None)[0]
+        self.projection.flags.writeable = False
+
+    def solve(self, y):
+        """Fit SurvSHAP(t) values for every column of y
+
+        Args:
+            y (numpy.ndarray): Coalition values minus the baseline, of shape (n_coalitions, n_timestamps).
+
+        Returns:
+            tuple: SurvSHAP(t) values of shape (n_variables, n_timestamps) and weighted R^2 for every timestamp.
+        """
+        shap_values = self.projection @ y
+        y_pred = self.simplified_inputs @ shap_values
+        return shap_values, self.r2(y, y_pred)
+
+    def r2(self, y, y_pred):
+        # vectorized sklearn.metrics.r2_score(y[:, i], y_pred[:, i], sample_weight=kernel_weights) for all i
+        w = self.kernel_weights.reshape((-1,) + (1,) * (y.ndim - 1))
+        numerator = np.sum(w * (y - y_pred) ** 2, axis=0)
+        y_mean = np.sum(w * y, axis=0) / np.sum(w)
+        denominator = np.sum(w * (y - y_mean) ** 2, axis=0)
+        r2 = np.ones_like(numerator)
+        valid = (numerator != 0) & (denominator != 0)
+        r2[valid] = 1 - numerator[valid] / denominator[valid]
+        r2[(numerator != 0) & (denominator == 0)] = 0.0
+        return r2
 
 
 def make_prediction_for_simplified_input(model, function_type, data, simplified_inputs, new_observation, timestamps):
-    preds = np.zeros((len(simplified_inputs), len(timestamps)))
-    for i, mask in enumerate(simplified_inputs):
-        X_tmp = pd.DataFrame(np.where(mask, new_observation, data), columns=data.columns)
-        preds[i,] = calculate_mean_function(model, function_type, X_tmp, timestamps)
-    return preds
+    return make_predictions_for_simplified_inputs(
+        model, function_type, data, simplified_inputs, new_observation, timestamps
+    )[0]
 
 
-def calculate_shap_values(
-    model,
-    function_type,
-    avg_function,
-    data,
-    simplified_inputs,
-    shap_kernel_weights,
-    new_observation,
-    timestamps,
+def make_predictions_for_simplified_inputs(
+    model, function_type, data, simplified_inputs, new_observations, timestamps
 ):
-    W = np.diag(shap_kernel_weights)
-    X = np.array(simplified_inputs)
-    R = np.linalg.inv(X.T @ W @ X) @ (X.T @ W)
-    y = (
-        make_prediction_for_simplified_input(model, function_type, data, simplified_inputs, new_observation, timestamps)
-        - avg_function
-    )
-    shap_values = R @ y
-    y_pred = X @ shap_values
-    r2 = [None] * y.shape[1]
-    for i in range(y.shape[1]):
-        r2[i] = r2_score(y[:, i], y_pred[:, i], sample_weight=shap_kernel_weights)
-    return shap_values, r2
+    # evaluates every (observation, coalition) pair; returns mean predictions of shape (N, M, T)
+    masks = np.asarray(simplified_inputs, dtype=bool).reshape(-1, data.shape[1])
+    evaluator = select_coalition_evaluator(model, function_type) if data is model.data else None
+    if evaluator is not None:
+        return evaluator.coalition_values(model, function_type, masks, new_observations, timestamps)
+    n_observations, n_coalitions, n_background = len(new_observations), len(masks), len(data)
+    n_pairs = n_observations * n_coalitions
+    pairs_per_batch = max(1, model.batch_size // n_background)
+    preds = np.zeros((n_pairs, len(timestamps)))
+    for start in range(0, n_pairs, pairs_per_batch):
+        pairs = np.arange(start, min(start + pairs_per_batch, n_pairs))
+        X_tmp = make_coalition_batch(
+            data, masks[pairs % n_coalitions], new_observations.iloc[pairs // n_coalitions]
+        )
+        batch_preds = model.predict_array(X_tmp, function_type, timestamps)
+        preds[pairs] = np.average(
+            batch_preds.reshape(len(pairs), n_background, len(timestamps)), axis=1, weights=model.background_weights
+        )
+    return preds.reshape(n_observations, n_coalitions, len(timestamps))
+
+
+def make_coalition_batch(data, masks, new_observations):
+    # rows are ordered coalition-major: all background rows for masks[0], then for masks[1], ...
+    # new_observations has either a single row or one row per mask
+    n_background = len(data)
+    columns = {}
+    for j in range(data.shape[1]):
+        background_values = data.iloc[:, j].to_numpy()
+        observation_values = new_observations.iloc[:, j].to_numpy()
+        if len(observation_values) > 1:
+            observation_values = np.repeat(observation_values, n_background)
+        replace = np.repeat(masks[:, j], n_background)
+        columns[j] = np.where(replace, observation_values, np.tile(background_values, len(masks)))
+    X_tmp = pd.DataFrame(columns)
+    X_tmp.columns = data.columns
+    return X_tmp
 
 
 def shap_sampling(
@@ -180,153 +333,295 @@ def shap_sampling(
     aggregation_method,
     timestamps,
     exact=False,
+    n_jobs=None,
+    tol=None,
+    path_sampling="random",
 ):
     p = new_observation.shape[1]
 
     # only one new_observation allowed
-    target_fun = explainer.predict(new_observation, function_type)[0]
-    all_functions = explainer.predict(explainer.data, function_type)
-
-    if timestamps is None:
-        target_fun = target_fun.y
-        all_functions_vals = [f.y for f in all_functions]
-        timestamps = all_functions[0].x
-    else:
-        target_fun = target_fun(timestamps)
-        all_functions_vals = [f(timestamps) for f in all_functions]
-    baseline_f = np.mean(all_functions_vals, axis=0)
+    target_fun, baseline_f, timestamps = prepare_functions(explainer, new_observation, function_type, timestamps)
+
+    # coalition values are memoized by their bitmask, so every coalition is predicted only once
+    coalition_cache = new_coalition_cache(p, baseline_f, target_fun)
+
+    state = {
+        "explainer": explainer,
+        "new_observation": new_observation,
+        "function_type": function_type,
+        "timestamps": timestamps,
+        "path": path,
+        "aggregation_method": aggregation_method,
+        "n_jobs": n_jobs,
+        "seed_entropy": np.random.SeedSequence(random_state).entropy,
+        "path_sampling": path_sampling,
+        "coalition_cache": coalition_cache,
+        "n_paths": 0,
+        "sum": np.zeros((p, len(timestamps))),
+        "sum_of_squares": np.zeros((p, len(timestamps))),
+        "paths": [],
+        "path_values": [],
+    }
 
     if exact:
-        permutations = [list(perm) for perm in itertools.permutations(np.arange(p), p)]
-        B = len(permutations)
-    else:
-        permutations = [None] * B
-
-    np.random.seed(random_state)
-    result_list = [
-        iterate_paths(
-            explainer,
-            function_type,
-            explainer.data,
-            new_observation,
-            timestamps,
-            p,
-            b + 1,
-            np.random,
-            permutations[b],
+        # the average over all p! paths equals the Shapley value computed from the 2**p coalitions
+        shap_values = get_exact_shapley_values(
+            explainer, function_type, explainer.data, new_observation, timestamps, coalition_cache
         )
-        for b in tqdm(range(B))
-    ]
-
-    result = pd.concat(result_list)
-
+        result = make_sampling_result(state, shap_values)
+        return result, target_fun, baseline_f, timestamps, None, None
+
+    add_sampling_paths(state, B, tol)
+    result, standard_errors = summarize_sampling_state(state)
+    return result, target_fun, baseline_f, timestamps, standard_errors, state
+
+
+def refine_shap_sampling(state, extra_B, tol=None):
+    add_sampling_paths(state, extra_B, tol)
+    return summarize_sampling_state(state)
+
+
+def add_sampling_paths(state, max_new_paths, tol=None):
+    # with tol, paths are added in rounds until the standard error of every aggregated change is at most tol
+    explainer = state["explainer"]
+    p = state["new_observation"].shape[1]
+    unit = sampling_unit(state["path_sampling"], p)
+    n_workers = effective_n_jobs(state["n_jobs"])
+    # rounds consist of whole pairs or blocks of dependent paths
+    round_size = max_new_paths if tol is None else unit * math.ceil(max(10, n_workers) / unit)
+    n_added = 0
+    while n_added < max_new_paths:
+        n_new = min(round_size, max_new_paths - n_added)
+        start = state["n_paths"]
+        paths = draw_paths(p, start, start + n_new, state["seed_entropy"], state["path_sampling"])
+        args = (explainer, state["function_type"], explainer.data, state["new_observation"], state["timestamps"])
+        if n_workers == 1 or n_new == 1:
+            path_values = get_path_values(*args, paths, state["coalition_cache"])
+        else:
+            # every worker gets its own copy of the cache and returns the coalitions it added; paths are drawn
+            # up front, so results do not depend on the number of workers
+            chunk_results = Parallel(n_jobs=state["n_jobs"])(
+                delayed(get_path_values_and_new_coalitions)(*args, paths_chunk, dict(state["coalition_cache"]))
+                for paths_chunk in np.array_split(paths, min(n_workers, n_new))
+            )
+            for _, new_coalitions in chunk_results:
+                state["coalition_cache"].update(new_coalitions)
+            path_values = np.concatenate([chunk_path_values for chunk_path_values, _ in chunk_results])
+
+        # changes are stored in the order of variables, the paths give the order of rows in the result
+        values = np.empty_like(path_values)
+        values[np.arange(n_new)[:, None], paths] = path_values
+        state["sum"] += values.sum(axis=0)
+        state["sum_of_squares"] += (values**2).sum(axis=0)
+        state["paths"].append(paths)
+        state["path_values"].append(values)
+        state["n_paths"] += n_new
+        n_added += n_new
+
+        if tol is not None and state["n_paths"] > 1:
+            standard_errors = get_standard_errors(state)
+            aggregated = aggregate_change(standard_errors, state["aggregation_method"], state["timestamps"])
+            if np.max(aggregated) <= tol:
+                break
+
+
+def sampling_unit(path_sampling, p):
+    # number of consecutive paths that are drawn together and form one independent sample
+    if path_sampling == "antithetic":
+        return 2
+    if path_sampling == "stratified":
+        return p
+    return 1
+
+
+def get_standard_errors(state):
+    n = state["n_paths"]
+    unit = sampling_unit(state["path_sampling"], state["new_observation"].shape[1])
+    if unit == 1:
+        variance = (state["sum_of_squares"] - state["sum"] ** 2 / n) / max(n - 1, 1)
+        return np.sqrt(np.maximum(variance, 0) / n)
+    # means of complete pairs or blocks are independent, a trailing incomplete one is left out
+    n_units = n // unit
+    if n_units < 2:
+        return np.full(state["sum"].shape, np.nan)
+    values = np.concatenate(state["path_values"])[: n_units * unit]
+    unit_means = values.reshape(n_units, unit, *values.shape[1:]).mean(axis=1)
+    return unit_means.std(axis=0, ddof=1) / np.sqrt(n_units)
+
+
+def summarize_sampling_state(state):
+    shap_values = state["sum"] / state["n_paths"]
+    result = make_sampling_result(state, shap_values)
+    standard_errors = get_standard_errors(state)
+    if isinstance(state["path"], str) and state["path"] == "average":
+        # same order of variables as in the averaged result
+        order = result.orders[0, 0]
+    else:
+        order = None
+    standard_errors = SurvSHAPResult(
+        standard_errors[None, None],
+        state["explainer"].data.columns,
+        state["new_observation"].to_numpy(),
+        state["timestamps"],
+        state["aggregation_method"],
+        orders=order,
+    ).to_frame()
+    return result, standard_errors.reset_index(drop=True)
+
+
+def make_sampling_result(state, shap_values):
+    # slots of the result are the average (B = 0) followed by paths 1, ..., n_paths,
+    # or paths 1, ..., n_paths followed by the chosen path (B = 0)
+    explainer = state["explainer"]
+    path = state["path"]
+    p = explainer.data.shape[1]
+    if state["paths"]:
+        orders = np.concatenate(state["paths"])
+        values = np.concatenate(state["path_values"])
+    else:
+        orders = np.empty((0, p), dtype=int)
+        values = np.empty((0, p, len(state["timestamps"])))
+    path_ids = np.arange(1, len(orders) + 1)
     if path is not None:
         if isinstance(path, str) and path == "average":
-            average_changes = (
-                result.groupby("variable_str").mean(numeric_only=True).iloc[:, 2:]
-            )  # choose predictions, not variable value and B
-            average_changes["aggregated_change"] = aggregate_change(average_changes, aggregation_method, timestamps)
-            average_changes = average_changes.sort_values("aggregated_change", ascending=False)
-            result_average = result_list[0].set_index("variable_str").reindex(average_changes.index).reset_index()
-            result_average = result_average.assign(B=0)
-            result_average.iloc[:, 4:] = average_changes.drop("aggregated_change", axis=1).values
-            result_average.insert(4, "aggregated_change", average_changes["aggregated_change"].values)
-            result = pd.concat((result_average, result), axis=0)
+            aggregated = aggregate_change(shap_values, state["aggregation_method"], state["timestamps"])
+            orders = np.vstack((np.argsort(-aggregated, kind="stable"), orders))
+            values = np.concatenate((shap_values[None], values))
+            path_ids = np.concatenate(([0], path_ids))
         else:
-            tmp = get_single_random_path(
+            path = np.asarray(path)
+            diffs = get_path_values(
                 explainer,
-                function_type,
+                state["function_type"],
                 explainer.data,
-                new_observation,
-                timestamps,
-                path,
-                0,
-            )
-            result = pd.concat((result, tmp))
-
-    return result, target_fun, baseline_f, timestamps
+                state["new_observation"],
+                state["timestamps"],
+                [path],
+                state["coalition_cache"],
+            )[0]
+            path_values = np.empty_like(diffs)
+            path_values[path] = diffs
+            orders = np.vstack((orders, path))
+            values = np.concatenate((values, path_values[None]))
+            path_ids = np.concatenate((path_ids, [0]))
+    return SurvSHAPResult(
+        values[None],
+        explainer.data.columns,
+        state["new_observation"].to_numpy(),
+        state["timestamps"],
+        state["aggregation_method"],
+        path_ids,
+        orders[None],
+    )
 
 
-def iterate_paths(model, function_type, data, new_observation, timestamps, p, b, rng, path):
-    if path is None:
-        random_path = rng.choice(np.arange(p), p, replace=False)
+def draw_paths(p, start, stop, seed_entropy, path_sampling="random"):
+    # path b depends only on the seed, b and the method, so any range of paths can be drawn independently,
+    # e.g. by different workers or when more paths are added later
+    if path_sampling == "random":
+        paths = [path_generator(seed_entropy, b).permutation(p) for b in range(start, stop)]
+    elif path_sampling == "antithetic":
+        # every second path is the reversed previous one
+        paths = [path_generator(seed_entropy, b // 2).permutation(p)[:: 1 - 2 * (b % 2)] for b in range(start, stop)]
+    elif path_sampling == "stratified":
+        # each block of p paths contains all cyclic shifts of a random permutation,
+        # so every variable appears exactly once at every position of the block
+        paths = [np.roll(path_generator(seed_entropy, b // p).permutation(p), -(b % p)) for b in range(start, stop)]
     else:
-        random_path = path
-    return get_single_random_path(model, function_type, data, new_observation, timestamps, random_path, b)
-
-
-def get_single_random_path(model, function_type, data, new_observation, timestamps, random_path, b):
-    current_data = deepcopy(data)
-    yhats = [None] * (len(random_path) + 1)
-    yhats[0] = calculate_mean_function(model, function_type, current_data, timestamps)
-    for i, candidate in enumerate(random_path):
-        current_data.iloc[:, candidate] = new_observation.iloc[0, candidate]
-        yhats[i + 1] = calculate_mean_function(model, function_type, current_data, timestamps)
-
-    diffs = np.diff(yhats, axis=0)
-
-    variable_names = data.columns[random_path]
-
-    new_observation_f = new_observation.loc[:, variable_names].apply(lambda x: nice_format(x.iloc[0]))
-
-    result_diffs = pd.DataFrame(diffs.tolist(), columns=[" = ".join(["t", str(time)]) for time in timestamps])
-    result_meta = pd.DataFrame(
-        {
-            "variable_str": [" = ".join(pair) for pair in zip(variable_names, new_observation_f)],
-            "variable_name": variable_names,
-            "variable_value": new_observation.loc[:, variable_names].values.reshape(
-                -1,
-            ),
-            "B": b,
-        }
-    )
+        raise ValueError("path_sampling should be 'random', 'antithetic' or 'stratified'")
+    return np.array(paths).reshape(-1, p)
+
+
+def path_generator(seed_entropy, b):
+    return np.random.default_rng(np.random.SeedSequence(seed_entropy, spawn_key=(b,)))
 
-    return pd.concat([result_meta, result_diffs], axis=1)
-
-
-def prepare_result_df(new_observation, variable_names, shap_values, timestamps, aggregation_method):
-    new_observation_f = new_observation.apply(lambda x: nice_format(x.iloc[0]))
-    result_shap = pd.DataFrame(shap_values, columns=[" = ".join(["t", str(time)]) for time in timestamps])
-    result_meta = pd.DataFrame(
-        {
-            "variable_str": [" = ".join(pair) for pair in zip(variable_names, new_observation_f)],
-            "variable_name": variable_names,
-            "variable_value": new_observation.values.reshape(
-                -1,
-            ),
-            "B": 0,
-            "aggregated_change": aggregate_change(result_shap, aggregation_method, timestamps),
-        }
+
+def get_path_values(model, function_type, data, new_observation, timestamps, paths, coalition_cache=None):
+    # the cumulative coalitions of all paths are stacked and evaluated with the batched coalition engine;
+    # returns the changes of the mean prediction of shape (B, p, T), ordered as in each path
+    paths = np.asarray(paths).reshape(-1, data.shape[1])
+    n_paths, p = paths.shape
+    ranks = np.argsort(paths, axis=1)
+    masks = ranks[:, None, :] < np.arange(p + 1)[None, :, None]
+    path_values = get_coalition_values(
+        model, function_type, data, new_observation, timestamps, masks.reshape(-1, p), coalition_cache
+    ).reshape(n_paths, p + 1, -1)
+    return np.diff(path_values, axis=1)
+
+
+def get_path_values_and_new_coalitions(
+    model, function_type, data, new_observation, timestamps, paths, coalition_cache
+):
+    # used by workers, whose additions to their copy of the cache are sent back to be merged
+    known = set(coalition_cache)
+    path_values = get_path_values(model, function_type, data, new_observation, timestamps, paths, coalition_cache)
+    return path_values, {key: value for key, value in coalition_cache.items() if key not in known}
+
+
+def get_exact_shapley_values(model, function_type, data, new_observation, timestamps, coalition_cache=None):
+    p = data.shape[1]
+    masks = exact_kernel_solver(p).simplified_inputs.astype(bool)
+    values = get_coalition_values(model, function_type, data, new_observation, timestamps, masks, coalition_cache)
+    # coalitions are in itertools.product order, so adding variable j to a coalition sets bit p - 1 - j of its index
+    codes = np.arange(2**p)
+    sizes = masks.sum(axis=1)
+    size_weights = np.array([math.factorial(s) * math.factorial(p - s - 1) / math.factorial(p) for s in range(p)])
+    shap_values = np.zeros((p, len(timestamps)))
+    for j in range(p):
+        bit = 1 << (p - 1 - j)
+        without_j = codes[(codes & bit) == 0]
+        shap_values[j] = size_weights[sizes[without_j]] @ (values[without_j | bit] - values[without_j])
+    return shap_values
+
+
+def get_coalition_values(model, function_type, data, new_observation, timestamps, masks, coalition_cache=None):
+    # mean predictions for coalitions given by masks of shape (n, p);
+    # only coalitions missing from the cache are predicted
+    if coalition_cache is None:
+        coalition_cache = {}
+    masks = np.asarray(masks, dtype=bool)
+    unique_packed, first_index, inverse = np.unique(
+        np.packbits(masks, axis=1), axis=0, return_index=True, return_inverse=True
     )
-    return pd.concat([result_meta, result_shap], axis=1)
+    keys = [row.tobytes() for row in unique_packed]
+    missing = [i for i, key in enumerate(keys) if key not in coalition_cache]
+    if missing:
+        missing_values = make_prediction_for_simplified_input(
+            model, function_type, data, masks[first_index[missing]], new_observation, timestamps
+        )
+        for i, value in zip(missing, missing_values):
+            coalition_cache[keys[i]] = value
+    unique_values = np.array([coalition_cache[key] for key in keys])
+    return unique_values[inverse.reshape(-1)]
 
 
-def aggregate_change(average_changes, aggregation_method, timestamps):
-    if aggregation_method == "sum_of_squares":
-        return np.sum(average_changes.values**2, axis=1)
-    if aggregation_method == "max_abs":
-        return np.max(np.abs(average_changes.values), axis=1)
-    if aggregation_method == "mean_abs":
-        return np.mean(np.abs(average_changes.values), axis=1)
-    if aggregation_method == "integral":
-        return trapezoid(np.abs(average_changes.values), timestamps)
+def new_coalition_cache(p, baseline_f, target_fun):
+    return {
+        coalition_key(np.zeros(p, dtype=bool)): baseline_f,
+        coalition_key(np.ones(p, dtype=bool)): target_fun,
+    }
 
 
-def calculate_mean_function(model, function_type, data, timestamps):
-    all_functions = model.predict(data, function_type)
-    all_function_vals = [f(timestamps) for f in all_functions]
-    return np.mean(all_function_vals, axis=0)
+def coalition_key(mask):
+    return np.packbits(np.asarray(mask, dtype=bool)).tobytes()
 
 
-def nice_format(x):
-    return str(x) if isinstance(x, (str, np.str_)) else str(float(signif(x)))
+def make_result(explainer, new_observations, shap_values, timestamps, aggregation_method):
+    # SurvSHAP(t) values of shape (N, p, T) as a result with a single path (B = 0) for every observation
+    return SurvSHAPResult(
+        shap_values[:, None],
+        explainer.data.columns,
+        new_observations.to_numpy(),
+        timestamps,
+        aggregation_method,
+    )
 
 
-def signif(x, p=4):
-    x = np.asarray(x)
-    x_positive = np.where(np.isfinite(x) & (x != 0), np.abs(x), 10 ** (p - 1))
-    mags = 10 ** (p - 1 - np.floor(np.log10(x_positive)))
-    return np.round(x * mags) / mags
+def prepare_functions(explainer, new_observation, function_type, timestamps):
+    timestamps = explainer.resolve_timestamps(function_type, timestamps)
+    target_fun = explainer.predict_array(new_observation, function_type, timestamps)[0]
+    baseline_f = explainer.baseline_function(function_type, timestamps)
+    return target_fun, baseline_f, timestamps
 
 
 def calculate_risk_table(ticks, event_times, event_ind):
@@ -0,0 +1,254 @@
+import numpy as np
+import pandas as pd
+from scipy.integrate import trapezoid
+
+
+class SurvSHAPResult:
+    def __init__(
+        self,
+        values,
+        variable_names,
+        variable_values,
+        timestamps,
+        aggregation_method="integral",
+        path_ids=None,
+        orders=None,
+    ):
+        """Constructor for class SurvSHAPResult, an array-backed store of SurvSHAP(t) values
+
+        Args:
+            values (numpy.ndarray): SurvSHAP(t) values of shape (n_observations, n_paths, n_variables, n_timestamps). Variables are in the order of `variable_names`.
+            variable_names (array_like): Names of the variables.
+            variable_values (numpy.ndarray): Values of the variables for the explained observations, of shape (n_observations, n_variables).
+            timestamps (numpy.ndarray): Timestamps at which SurvSHAP(t) values are calculated.
+            aggregation_method (str, optional): One of "sum_of_squares", "max_abs", "mean_abs" or "integral". Default method of aggregating SurvSHAP(t) values over time. Defaults to "integral".
+            path_ids (array_like, optional): Labels of the paths, shown in column "B" of the DataFrame view. Label 0 marks the explanation, that is the average over paths or the chosen path. Defaults to None (a single path labelled 0).
+            orders (numpy.ndarray, optional): Order of variables in every path, of shape (n_observations, n_paths, n_variables). Used as the order of rows in the DataFrame view. Defaults to None (order of `variable_names`).
+        """
+        self.values = np.asarray(values, dtype=float)
+        n_observations, n_paths, p, _ = self.values.shape
+        self.variable_names = pd.Index(variable_names)
+        self.variable_values = np.asarray(variable_values).reshape(n_observations, p)
+        self.timestamps = np.asarray(timestamps)
+        self.aggregation_method = aggregation_method
+        self.path_ids = np.zeros(1, dtype=int) if path_ids is None else np.asarray(path_ids, dtype=int)
+        if orders is None:
+            orders = np.broadcast_to(np.arange(p), (n_observations, n_paths, p))
+        self.orders = np.asarray(orders).reshape(n_observations, n_paths, p)
+
+    @property
+    def n_observations(self):
+        return self.values.shape[0]
+
+    @property
+    def shap_values(self):
+        # values of the explanation (path labelled 0) of shape (n_observations, n_variables, n_timestamps)
+        slots = np.flatnonzero(self.path_ids == 0)
+        if len(slots) == 0:
+            return None
+        return self.values[:, slots[0]]
+
+    def aggregated_change(self, aggregation_method=None):
+        """Aggregate SurvSHAP(t) values of the explanation over time
+
+        Args:
+            aggregation_method (str, optional): One of "sum_of_squares", "max_abs", "mean_abs" or "integral". Defaults to None (`aggregation_method` of the result).
+
+        Returns:
+            numpy.ndarray: Aggregated changes of shape (n_observations, n_variables).
+        """
+        if aggregation_method is None:
+            aggregation_method = self.aggregation_method
+        return aggregate_change(self.shap_values, aggregation_method, self.timestamps)
+
+    def mean_abs_shap_values(self):
+        """Calculate mean absolute SurvSHAP(t) values of the explanation over observations
+
+        Returns:
+            numpy.ndarray: Mean absolute values of shape (n_variables, n_timestamps).
+        """
+        return np.mean(np.abs(self.shap_values), axis=0)
+
+    def observation(self, i):
+        """Get the result for a single observation
+
+        Args:
+            i (int): Position of the observation.
+
+        Returns:
+            SurvSHAPResult: Result sharing the arrays of this one.
+        """
+        return SurvSHAPResult(
+            self.values[i : i + 1],
+            self.variable_names,
+            self.variable_values[i : i + 1],
+            self.timestamps,
+            self.aggregation_method,
+            self.path_ids,
+            self.orders[i : i + 1],
+        )
+
+    def explanation_rows(self, i=0):
+        """Get the rows of the explanation (path labelled 0) of a single observation, in the order of the DataFrame view
+
+        Args:
+            i (int, optional): Position of the observation. Defaults to 0.
+
+        Returns:
+            tuple: Names, values, SurvSHAP(t) values of shape (n_variables, n_timestamps) and aggregated changes of the variables.
+        """
+        slot = np.flatnonzero(self.path_ids == 0)[0]
+        order = self.orders[i, slot]
+        shap_values = self.values[i, slot, order]
+        return (
+            self.variable_names[order],
+            self.variable_values[i, order],
+            shap_values,
+            aggregate_change(shap_values, self.aggregation_method, self.timestamps),
+        )
+
+    def to_frame(self, explanation_only=False, add_index=False):
+        """Build the DataFrame view of the result
+
+        Every row contains SurvSHAP(t) values of one variable in one path for one observation, in columns "t = ...".
+
+        Args:
+            explanation_only (bool, optional): If True, only rows of the explanation (path labelled 0) are included. Defaults to False.
+            add_index (bool, optional): If True, column "index" with the position of the observation is included. Defaults to False.
+
+        Returns:
+            pandas.DataFrame: Result with columns "variable_str", "variable_name", "variable_value", "B", "aggregated_change", optionally "index", and SurvSHAP(t) values.
+        """
+        n_observations, n_paths, p, n_timestamps = self.values.shape
+        slots = np.flatnonzero(self.path_ids == 0) if explanation_only else np.arange(n_paths)
+        orders = self.orders[:, slots]
+        observation_ids = np.repeat(np.arange(n_observations), len(slots) * p)
+        variable_ids = orders.reshape(-1)
+        path_ids = np.tile(np.repeat(self.path_ids[slots], p), n_observations)
+        values = np.take_along_axis(self.values[:, slots], orders[..., None], axis=2).reshape(-1, n_timestamps)
+
+        # changes are aggregated only for the explanation rows, as in the averaged result
+        aggregated = np.full(len(values), np.nan)
+        explanation = path_ids == 0
+        if explanation.any():
+            aggregated[explanation] = aggregate_change(values[explanation], self.aggregation_method, self.timestamps)
+
+        formatted = np.array([[nice_format(x) for x in row] for row in self.variable_values], dtype=object)
+        names = np.asarray(self.variable_names, dtype=object)[variable_ids]
+        meta = {
+            "variable_str": [" = ".join(pair) for pair in zip(names, formatted[observation_ids, variable_ids])],
+            "variable_name": names,
+            "variable_value": self.variable_values[observation_ids, variable_ids],
+            "B": path_ids,
+            "aggregated_change": aggregated,
+        }
+        if add_index:
+            meta["index"] = observation_ids
+        result_meta = pd.DataFrame(meta, index=variable_ids)
+        result_values = pd.DataFrame(
+            values, columns=[" = ".join(["t", str(time)]) for time in self.timestamps], index=variable_ids
+        )
+        return pd.concat([result_meta, result_values], axis=1)
+
+
+class SurvSHAPStatistics:
+    def __init__(self, variable_names, timestamps):
+        """Constructor for class SurvSHAPStatistics, running statistics of SurvSHAP(t) values over explained observations
+
+        Args:
+            variable_names (array_like): Names of the variables.
+            timestamps (numpy.ndarray): Timestamps at which SurvSHAP(t) values are calculated.
+        """
+        self.variable_names = pd.Index(variable_names)
+        self.timestamps = np.asarray(timestamps)
+        self.n_observations = 0
+        self.shap_sum = np.zeros((len(self.variable_names), len(self.timestamps)))
+        self.abs_shap_sum = np.zeros((len(self.variable_names), len(self.timestamps)))
+        self.shap_square_sum = np.zeros((len(self.variable_names), len(self.timestamps)))
+        self.abs_value_sum = np.zeros(len(self.variable_names))
+
+    def update(self, result):
+        """Add SurvSHAP(t) values of new observations
+
+        Args:
+            result (SurvSHAPResult): Result for the new observations, calculated for the same variables and timestamps.
+
+        Raises:
+            ValueError: if `result` is calculated for other variables or timestamps
+        """
+        if not self.variable_names.equals(result.variable_names) or not np.array_equal(
+            self.timestamps, result.timestamps
+        ):
+            raise ValueError("result should be calculated for the same variables and timestamps as the statistics")
+        shap_values = result.shap_values
+        self.n_observations += result.n_observations
+        self.shap_sum += shap_values.sum(axis=0)
+        self.abs_shap_sum += np.abs(shap_values).sum(axis=0)
+        self.shap_square_sum += (shap_values**2).sum(axis=0)
+        self.abs_value_sum += np.abs(result.variable_values.astype(float)).sum(axis=0)
+
+    def merge(self, other):
+        """Add statistics of other observations
+
+        Args:
+            other (SurvSHAPStatistics): Statistics calculated for the same variables and timestamps.
+
+        Raises:
+            ValueError: if `other` is calculated for other variables or timestamps
+        """
+        if not self.variable_names.equals(other.variable_names) or not np.array_equal(
+            self.timestamps, other.timestamps
+        ):
+            raise ValueError("statistics should be calculated for the same variables and timestamps")
+        self.n_observations += other.n_observations
+        self.shap_sum += other.shap_sum
+        self.abs_shap_sum += other.abs_shap_sum
+        self.shap_square_sum += other.shap_square_sum
+        self.abs_value_sum += other.abs_value_sum
+
+    def mean_shap_values(self):
+        return self.shap_sum / self.n_observations
+
+    def mean_abs_shap_values(self):
+        """Calculate mean absolute SurvSHAP(t) values over observations
+
+        Returns:
+            numpy.ndarray: Mean absolute values of shape (n_variables, n_timestamps).
+        """
+        return self.abs_shap_sum / self.n_observations
+
+    def std_abs_shap_values(self):
+        """Calculate standard deviations of absolute SurvSHAP(t) values over observations
+
+        Returns:
+            numpy.ndarray: Population standard deviations of shape (n_variables, n_timestamps).
+        """
+        mean_abs_shap_values = self.mean_abs_shap_values()
+        # rounding errors can make the difference slightly negative
+        return np.sqrt(np.maximum(self.shap_square_sum / self.n_observations - mean_abs_shap_values**2, 0))
+
+    def mean_abs_variable_values(self):
+        return self.abs_value_sum / self.n_observations
+
+
+def aggregate_change(average_changes, aggregation_method, timestamps):
+    average_changes = np.asarray(average_changes)
+    if aggregation_method == "sum_of_squares":
+        return np.sum(average_changes**2, axis=-1)
+    if aggregation_method == "max_abs":
+        return np.max(np.abs(average_changes), axis=-1)
+    if aggregation_method == "mean_abs":
+        return np.mean(np.abs(average_changes), axis=-1)
+    if aggregation_method == "integral":
+        return trapezoid(np.abs(average_changes), timestamps)
+
+
+def nice_format(x):
+    return str(x) if isinstance(x, (str, np.str_)) else str(float(signif(x)))
+
+
+def signif(x, p=4):
+    x = np.asarray(x)
+    x_positive = np.where(np.isfinite(x) & (x != 0), np.abs(x), 10 ** (p - 1))
+    mags = 10 ** (p - 1 - np.floor(np.log10(x_positive)))
+    return np.round(x * mags) / mags
@@ -0,0 +1,104 @@
+import numpy as np
+from .predict_explanations.utils import make_shap_kernel_explainer
+from .treeshap import ensemble_trees
+
+
+class SurvSHAPSession:
+    def __init__(self, explainer, function_type="sf", timestamps=None, **kwargs):
+        """Constructor for class SurvSHAPSession, explanation backends of an explainer built once and reused
+
+        A session is passed to `PredictSurvSHAP.fit` in place of the explainer, so that repeated explanations of single observations (e.g. one per request of a service) do not rebuild the shap.KernelExplainer of calculation_method "shap_kernel", tree structures of calculation_method "treeshap", background predictions, the baseline function and timestamps. Backends are kept by the session and freed with it, they are rebuilt after the cache of `explainer` is cleared, e.g. when its model, data or background weights are changed.
+
+        Args:
+            explainer (SurvivalModelExplainer): A wrapper object for the model to be explained.
+            function_type (str, optional): Either "sf" representing survival function or "chf" representing cumulative hazard function. Defaults to "sf".
+            timestamps (numpy.Array or str, optional): An array of timestamps at which SurvSHAP(t) values are calculated, or one of "quantiles", "knots" or "tolerance" to choose a reduced grid automatically (see `SurvivalModelExplainer.select_timestamps`). Defaults to None.
+            **kwargs (optional): Additional parameters passed for shap.KernelExplainer.
+        """
+        self.explainer = explainer
+        self.function_type = function_type
+        self._timestamps = timestamps
+        self.kwargs = kwargs
+        self._backends_generation = None
+        self._backend_cache = {}
+
+    def _backends(self):
+        # backends are dropped together with the cache of the explainer, e.g. after its model is changed
+        if self._backends_generation != self.explainer._cache_generation:
+            self._backend_cache = {}
+            self._backends_generation = self.explainer._cache_generation
+        return self._backend_cache
+
+    @property
+    def timestamps(self):
+        backends = self._backends()
+        if "timestamps" not in backends:
+            backends["timestamps"] = self.explainer.resolve_timestamps(self.function_type, self._timestamps)
+        return backends["timestamps"]
+
+    def baseline_function(self):
+        """Mean prediction for the background data at the timestamps of the session
+
+        Returns:
+            numpy.ndarray: A read-only array of shape (n_timestamps,).
+        """
+        return self.explainer.baseline_function(self.function_type, self.timestamps)
+
+    def kernel_explainer(self):
+        """shap.KernelExplainer of the session, built at the first call
+
+        Returns:
+            shap.KernelExplainer: Explainer of functions evaluated at the timestamps of the session.
+        """
+        backends = self._backends()
+        if "shap_kernel" not in backends:
+            backends["shap_kernel"] = make_shap_kernel_explainer(
+                self.explainer, self.function_type, self.timestamps, **self.kwargs
+            )
+        return backends["shap_kernel"]
+
+    def prepare(self, calculation_method="kernel"):
+        """Build backends of a calculation method before the first explanation
+
+        Args:
+            calculation_method (str, optional): One of "kernel", "sampling", "shap_kernel" or "treeshap", see `PredictSurvSHAP`. Defaults to "kernel".
+
+        Returns:
+            SurvSHAPSession: The session itself.
+
+        Raises:
+            ValueError: if calculation_method is invalid
+        """
+        if calculation_method not in ["kernel", "sampling", "shap_kernel", "treeshap"]:
+            raise ValueError("calculation_method should be 'kernel', 'sampling', 'shap_kernel', or 'treeshap'")
+        self.baseline_function()
+        if calculation_method == "shap_kernel":
+            self.kernel_explainer()
+        elif calculation_method == "treeshap":
+            ensemble_trees(self.explainer)
+        return self
+
+    def resolve_timestamps(self, function_type, timestamps):
+        """Check settings of an explanation against the session
+
+        Args:
+            function_type (str): Type of function of the explanation.
+            timestamps (numpy.Array or str, optional): Timestamps of the explanation, None for those of the session.
+
+        Returns:
+            numpy.ndarray: Timestamps of the session.
+
+        Raises:
+            ValueError: if function_type or timestamps differ from those of the session
+        """
+        if function_type != self.function_type:
+            raise ValueError("function_type of the explanation differs from function_type of the session")
+        if isinstance(timestamps, str):
+            same_timestamps = timestamps == self._timestamps
+        else:
+            same_timestamps = timestamps is None or (
+                np.shape(timestamps) == np.shape(self.timestamps) and np.array_equal(timestamps, self.timestamps)
+            )
+        if not same_timestamps:
+            raise ValueError("timestamps of the explanation differ from timestamps of the session")
+        return self.timestamps
@@ -0,0 +1,115 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+from .result import SurvSHAPResult
+
+
+def read_observation_chunks(source, chunk_size=1000):
+    # yields DataFrames with at most chunk_size rows; parquet files are read batch by batch from their row groups,
+    # CSV files with pandas chunks, so that only one chunk is held in memory
+    if isinstance(source, pd.DataFrame):
+        for start in range(0, len(source), chunk_size):
+            yield source.iloc[start : start + chunk_size]
+    elif isinstance(source, (str, os.PathLike)):
+        extension = os.path.splitext(os.fspath(source))[1].lower()
+        start = 0
+        if extension in [".parquet", ".pq"]:
+            try:
+                import pyarrow.parquet
+            except ImportError:
+                raise ImportError("reading parquet files requires the pyarrow package")
+            for batch in pyarrow.parquet.ParquetFile(source).iter_batches(batch_size=chunk_size):
+                chunk = batch.to_pandas()
+                chunk.index = pd.RangeIndex(start, start + len(chunk))
+                start += len(chunk)
+                yield chunk
+        elif extension == ".csv":
+            for chunk in pd.read_csv(source, chunksize=chunk_size):
+                yield chunk
+        else:
+            raise ValueError("source file should have one of the extensions '.parquet', '.pq' or '.csv'")
+    else:
+        raise TypeError("source must be a pandas.DataFrame or a path to a parquet or CSV file")
+
+
+class SurvSHAPResultStore:
+    def __init__(self, path):
+        """Constructor for class SurvSHAPResultStore, an append-only directory of SurvSHAP(t) results
+
+        Every appended result is written to its own file, so results already written are never modified.
+
+        Args:
+            path (str): Path to the directory. It is created if it does not exist.
+        """
+        self.path = os.fspath(path)
+        os.makedirs(self.path, exist_ok=True)
+
+    def __len__(self):
+        return len(self.chunk_files())
+
+    def __iter__(self):
+        for file_name in self.chunk_files():
+            yield self.read_chunk(file_name)
+
+    def chunk_files(self):
+        return sorted(name for name in os.listdir(self.path) if name.startswith("chunk_") and name.endswith(".npz"))
+
+    def append(self, result):
+        """Write a result as the next chunk of the store
+
+        Args:
+            result (SurvSHAPResult): Result to be written.
+        """
+        file_name = os.path.join(self.path, f"chunk_{len(self):08d}.npz")
+        # the file appears under its final name only when it is complete
+        tmp_file_name = file_name + ".tmp"
+        with open(tmp_file_name, "wb") as f:
+            np.savez(
+                f,
+                values=result.values,
+                variable_values=result.variable_values,
+                timestamps=result.timestamps,
+                path_ids=result.path_ids,
+                orders=result.orders,
+                metadata=json.dumps(
+                    {
+                        "variable_names": [str(name) for name in result.variable_names],
+                        "aggregation_method": result.aggregation_method,
+                    }
+                ),
+            )
+        os.replace(tmp_file_name, file_name)
+
+    def read_chunk(self, file_name):
+        with np.load(os.path.join(self.path, file_name), allow_pickle=True) as f:
+            metadata = json.loads(str(f["metadata"]))
+            return SurvSHAPResult(
+                f["values"],
+                metadata["variable_names"],
+                f["variable_values"],
+                f["timestamps"],
+                metadata["aggregation_method"],
+                f["path_ids"],
+                f["orders"],
+            )
+
+    def load(self):
+        """Read all chunks of the store as a single result
+
+        Returns:
+            SurvSHAPResult: Result for all observations in the order in which they were appended.
+        """
+        chunks = list(self)
+        if not chunks:
+            return None
+        first = chunks[0]
+        return SurvSHAPResult(
+            np.concatenate([chunk.values for chunk in chunks]),
+            first.variable_names,
+            np.concatenate([chunk.variable_values for chunk in chunks]),
+            first.timestamps,
+            first.aggregation_method,
+            first.path_ids,
+            np.concatenate([chunk.orders for chunk in chunks]),
+        )
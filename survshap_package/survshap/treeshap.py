@@ -0,0 +1,277 @@
+from functools import lru_cache
+import math
+import numpy as np
+import pandas as pd
+from sksurv.ensemble import ExtraSurvivalTrees, GradientBoostingSurvivalAnalysis, RandomSurvivalForest
+from .explainer import evaluate_step_values, proportional_hazards_baseline
+
+
+def tree_shap_values(
+    explainer,
+    new_observations,
+    function_type,
+    timestamps=None,
+    time_block_size=256,
+    max_block_elements=2**20,
+):
+    """Calculate interventional TreeSHAP values of survival or cumulative hazard functions of a tree ensemble
+
+    Every tree is walked once. For a pair of an explained and a background observation a leaf is reached by the
+    coalitions that take all variables, on which the explained observation fails the conditions of the leaf, from the
+    background observation and vice versa, so Shapley values of the pair follow from the number of such variables.
+    For survival forests whole leaf functions are propagated, which gives SurvSHAP(t) values for all timestamps at
+    once. For gradient boosting with the Cox loss, values of the additive log-risk of every pair are rescaled to the
+    change of S_0(t)^exp(f) or H_0(t) exp(f) between the pair, as shap.TreeExplainer does for transformed outputs.
+    These values add up to the prediction, but they are only an approximation of Shapley values of the survival or
+    cumulative hazard function, which is not additive in the trees.
+
+    Args:
+        explainer (SurvivalModelExplainer): A wrapper object for the model to be explained, the model must be of class sksurv.ensemble.RandomSurvivalForest, sksurv.ensemble.ExtraSurvivalTrees or sksurv.ensemble.GradientBoostingSurvivalAnalysis with loss="coxph".
+        new_observations (pandas.DataFrame): Observations to be explained.
+        function_type (str): Either "sf" representing survival function or "chf" representing cumulative hazard function.
+        timestamps (numpy.Array, optional): An array of timestamps at which SurvSHAP(t) values are calculated. Defaults to None (`explainer.model.unique_times_`).
+        time_block_size (int, optional): Number of timestamps for which leaf functions are propagated at once. Defaults to 256.
+        max_block_elements (int, optional): Maximum size of the (leaves x explained x background observations) arrays, new observations are split into blocks to respect it. Defaults to 2**20.
+
+    Returns:
+        numpy.ndarray: SurvSHAP(t) values of shape (n_observations, n_variables, n_timestamps), averaged over background observations with `explainer.background_weights`.
+
+    Raises:
+        TypeError: if the model is not one of the supported tree ensembles
+        ValueError: if the data contain missing values, or trees of a gradient boosting model do not reproduce its predictions
+    """
+    model = explainer.model
+    if isinstance(model, GradientBoostingSurvivalAnalysis):
+        if model.loss != "coxph":
+            raise TypeError("calculation_method 'treeshap' supports GradientBoostingSurvivalAnalysis only with loss='coxph'")
+        calculate = boosting_shap_values
+    elif isinstance(model, (RandomSurvivalForest, ExtraSurvivalTrees)):
+        if getattr(model, "low_memory", False):
+            raise ValueError("calculation_method 'treeshap' requires a model fitted with low_memory=False")
+        calculate = forest_shap_values
+    else:
+        raise TypeError(
+            "explained model must be of class sksurv.ensemble.RandomSurvivalForest, sksurv.ensemble.ExtraSurvivalTrees"
+            " or sksurv.ensemble.GradientBoostingSurvivalAnalysis"
+        )
+    if timestamps is None:
+        timestamps = model.unique_times_
+    # trees compare float32 features with float64 thresholds
+    X = np.asarray(new_observations, dtype=np.float32).astype(float)
+    Z = np.asarray(explainer.data, dtype=np.float32).astype(float)
+    if np.isnan(X).any() or np.isnan(Z).any():
+        raise ValueError("calculation_method 'treeshap' does not support missing values")
+    weights = np.ones(len(Z)) if explainer.background_weights is None else np.asarray(explainer.background_weights)
+    weights = weights / weights.sum()
+    return calculate(explainer, X, Z, weights, function_type, timestamps, time_block_size, max_block_elements)
+
+
+def forest_shap_values(explainer, X, Z, weights, function_type, timestamps, time_block_size, max_block_elements):
+    # the forest predicts the mean of leaf functions of its trees
+    trees = ensemble_trees(explainer)
+    knots = explainer.model.unique_times_
+    # sksurv stores the cumulative hazard function in the first and the survival function in the second column
+    column = 1 if function_type == "sf" else 0
+    n_features = X.shape[1]
+    shap_values = np.zeros((len(X), n_features, len(timestamps)))
+    max_leaves = max(len(tree["leaves"]) for tree in trees)
+    block_size = max(1, max_block_elements // (len(Z) * max_leaves))
+    # coefficients of leaves of many trees are multiplied by leaf functions at once
+    max_group_leaves = max(max_leaves, max_block_elements // (block_size * n_features))
+    for start in range(0, len(X), block_size):
+        x_block = X[start : start + block_size]
+        group = []
+        for i, tree in enumerate(trees):
+            group.append((tree_coefficients(tree, x_block, Z, weights, n_features), tree["values"][:, :, column]))
+            n_group_leaves = sum(len(values) for _, values in group)
+            if i == len(trees) - 1 or n_group_leaves + len(trees[i + 1]["leaves"]) > max_group_leaves:
+                coefficients = np.concatenate([c for c, _ in group], axis=1)
+                values = np.concatenate([v for _, v in group])
+                for t_start in range(0, len(timestamps), time_block_size):
+                    t_stop = t_start + time_block_size
+                    leaf_values = evaluate_step_values(knots, values, timestamps[t_start:t_stop], (0, knots[-1]))
+                    shap_values[start : start + len(x_block), :, t_start:t_stop] += (
+                        coefficients @ leaf_values
+                    ).reshape(len(x_block), n_features, -1)
+                group = []
+    return shap_values / len(trees)
+
+
+def boosting_shap_values(explainer, X, Z, weights, function_type, timestamps, time_block_size, max_block_elements):
+    # S(t | x) = S_0(t)^exp(f(x)) and H(t | x) = H_0(t) exp(f(x)), where f is the sum of scaled regression trees
+    model = explainer.model
+    trees = ensemble_trees(explainer)
+    x_risk = model.predict(pd.DataFrame(X, columns=explainer.data.columns))
+    z_risk = model.predict(pd.DataFrame(Z, columns=explainer.data.columns))
+    # trees are read from sksurv internals, so they must reproduce the predictions up to the initial estimate
+    z_margin = sum(
+        tree["values"] @ in_leaf_boxes(Z[:, tree["features"]], tree["lower"], tree["upper"]).prod(axis=2)
+        for tree in trees
+    )
+    if np.ptp(z_risk - z_margin) > 1e-6 * max(1, np.max(np.abs(z_risk))):
+        raise ValueError(
+            "trees of the model do not reproduce its predictions, this version of sksurv may not be supported"
+        )
+    baseline = proportional_hazards_baseline(explainer, function_type, timestamps, z_risk)
+    n_features = X.shape[1]
+    shap_values = np.zeros((len(X), n_features, len(timestamps)))
+    max_leaves = max(len(tree["leaves"]) for tree in trees)
+    block_size = max(1, max_block_elements // (len(Z) * max(max_leaves, n_features, time_block_size)))
+    for start in range(0, len(X), block_size):
+        x_block = X[start : start + block_size]
+        # TreeSHAP values of the log-risk for every pair of an explained and a background observation
+        pair_values = np.zeros((len(x_block), len(Z), n_features))
+        for tree in trees:
+            used = tree["features"]
+            x_in_leaf = in_leaf_boxes(x_block[:, used], tree["lower"], tree["upper"])
+            z_in_leaf = in_leaf_boxes(Z[:, used], tree["lower"], tree["upper"])
+            x_weights, z_weights = leaf_pair_weights(x_in_leaf, z_in_leaf)
+            values = tree["values"][:, None, None]
+            pair_values[:, :, used] += np.einsum("lnm,lnj,lmj->nmj", x_weights * values, x_in_leaf, 1 - z_in_leaf)
+            pair_values[:, :, used] -= np.einsum("lnm,lnj,lmj->nmj", z_weights * values, 1 - x_in_leaf, z_in_leaf)
+        pair_values = (pair_values * weights[None, :, None]).transpose(0, 2, 1)
+
+        risk_difference = x_risk[start : start + len(x_block), None] - z_risk[None]
+        same_risk = np.abs(risk_difference) < 1e-8
+        risk_difference[same_risk] = 1
+        for t_start in range(0, len(timestamps), time_block_size):
+            t_stop = t_start + time_block_size
+            scale = rescaling_factors(
+                x_risk[start : start + len(x_block)], z_risk, baseline[t_start:t_stop], function_type
+            )
+            scale = np.where(same_risk[:, :, None], scale[1], scale[0] / risk_difference[:, :, None])
+            shap_values[start : start + len(x_block), :, t_start:t_stop] = np.matmul(pair_values, scale)
+    return shap_values
+
+
+def rescaling_factors(x_risk, z_risk, baseline, function_type):
+    # differences g(f(x)) - g(f(z)) of the functions of a pair and derivatives g'(f(x)) for pairs with equal log-risk
+    x_hazard_ratio = np.exp(x_risk)[:, None, None]
+    z_hazard_ratio = np.exp(z_risk)[None, :, None]
+    if function_type == "sf":
+        x_values = baseline**x_hazard_ratio
+        with np.errstate(divide="ignore"):
+            log_baseline = np.where(baseline > 0, np.log(np.where(baseline > 0, baseline, 1)), 0)
+        return x_values - baseline**z_hazard_ratio, x_values * log_baseline * x_hazard_ratio
+    return baseline * (x_hazard_ratio - z_hazard_ratio), baseline * x_hazard_ratio
+
+
+def ensemble_trees(explainer):
+    # leaf boxes and leaf values of all trees, cached with the predictions of the explainer
+    model = explainer.model
+    key = ("trees",)
+    if key not in explainer._cache:
+        if isinstance(model, GradientBoostingSurvivalAnalysis):
+            # boosting with dropout scales every stage by its own factor, stored only in a private attribute
+            if model.dropout_rate > 0:
+                if not hasattr(model, "_scale"):
+                    raise ValueError(
+                        "scaling factors of trees fitted with dropout are not available in this version of sksurv"
+                    )
+                scales = model.learning_rate * model._scale
+            else:
+                scales = np.full(len(model.estimators_), model.learning_rate)
+            trees = []
+            for estimator, scale in zip(model.estimators_[:, 0], scales):
+                tree = tree_structure(estimator.tree_)
+                tree["values"] = estimator.tree_.value[tree["leaves"], 0, 0] * scale
+                trees.append(tree)
+        else:
+            trees = []
+            for estimator in model.estimators_:
+                tree = tree_structure(estimator.tree_)
+                tree["values"] = estimator.tree_.value[tree["leaves"]]
+                trees.append(tree)
+        explainer._cache[key] = trees
+    return explainer._cache[key]
+
+
+def tree_structure(tree):
+    # every leaf is a box lower < x <= upper in the variables used for splits in the tree
+    children_left = tree.children_left
+    children_right = tree.children_right
+    features = np.unique(tree.feature[children_left != -1])
+    positions = np.searchsorted(features, tree.feature)
+    leaves, lower, upper = [], [], []
+    stack = [(0, np.full(len(features), -np.inf), np.full(len(features), np.inf))]
+    while stack:
+        node, node_lower, node_upper = stack.pop()
+        if children_left[node] == -1:
+            leaves.append(node)
+            lower.append(node_lower)
+            upper.append(node_upper)
+            continue
+        j = positions[node]
+        left_upper = node_upper.copy()
+        left_upper[j] = min(left_upper[j], tree.threshold[node])
+        right_lower = node_lower.copy()
+        right_lower[j] = max(right_lower[j], tree.threshold[node])
+        stack.append((children_left[node], node_lower, left_upper))
+        stack.append((children_right[node], right_lower, node_upper))
+    return {
+        "features": features,
+        "leaves": np.array(leaves),
+        "lower": np.array(lower).reshape(len(leaves), len(features)),
+        "upper": np.array(upper).reshape(len(leaves), len(features)),
+    }
+
+
+def tree_coefficients(tree, X, Z, background_weights, n_features):
+    # (n_observations * n_features, n_leaves) coefficients of leaf functions in SurvSHAP(t) values
+    used = tree["features"]
+    coefficients = np.zeros((len(X), n_features, len(tree["leaves"])))
+    coefficients[:, used] = leaf_coefficients(
+        in_leaf_boxes(X[:, used], tree["lower"], tree["upper"]),
+        in_leaf_boxes(Z[:, used], tree["lower"], tree["upper"]),
+        background_weights,
+    ).transpose(1, 2, 0)
+    return coefficients.reshape(len(X) * n_features, -1)
+
+
+def in_leaf_boxes(X, lower, upper):
+    # (n_leaves, n_observations, n_features) indicators of the observation satisfying the conditions of a leaf
+    X = X[None]
+    return ((X > lower[:, None]) & (X <= upper[:, None])).astype(float)
+
+
+def leaf_coefficients(x_in_leaf, z_in_leaf, background_weights):
+    # (n_leaves, n_observations, n_features) coefficients of the leaf functions, averaged over background
+    x_weights, z_weights = leaf_pair_weights(x_in_leaf, z_in_leaf)
+    weighted_z_in_leaf = z_in_leaf * background_weights[:, None]
+    return x_in_leaf * ((x_weights @ background_weights)[:, :, None] - np.matmul(x_weights, weighted_z_in_leaf)) - (
+        1 - x_in_leaf
+    ) * np.matmul(z_weights, weighted_z_in_leaf)
+
+
+def leaf_pair_weights(x_in_leaf, z_in_leaf):
+    # (n_leaves, n_observations, n_background) weights of a leaf in values of variables taken from x and from z
+    n_features = x_in_leaf.shape[2]
+    size = n_features + 1
+    x_count = x_in_leaf.sum(axis=2)
+    z_count = z_in_leaf.sum(axis=2)
+    both_count = np.matmul(x_in_leaf, z_in_leaf.transpose(0, 2, 1))
+    # index of (variables satisfied only by x, only by z, by neither) in the weight tables, which is linear in the counts
+    index = (
+        both_count * (1 - size**2 - size)
+        + (x_count * (size**2 - 1) + n_features)[:, :, None]
+        + (z_count * (size - 1))[:, None, :]
+    ).astype(np.intp)
+    x_table, z_table = coalition_weight_tables(n_features)
+    return x_table.take(index), z_table.take(index)
+
+
+@lru_cache(maxsize=None)
+def coalition_weight_tables(n_features):
+    # a leaf is reached only if no variable fails its conditions in both x and z; then with a variables satisfied
+    # only by x and b only by z, each of the former gets (a - 1)! b! / (a + b)! of the leaf function and each of the
+    # latter -a! (b - 1)! / (a + b)!
+    size = n_features + 1
+    x_table = np.zeros((size, size, size))
+    z_table = np.zeros((size, size, size))
+    for a in range(size):
+        for b in range(size - a):
+            if a > 0:
+                x_table[a, b, 0] = math.factorial(a - 1) * math.factorial(b) / math.factorial(a + b)
+            if b > 0:
+                z_table[a, b, 0] = math.factorial(a) * math.factorial(b - 1) / math.factorial(a + b)
+    return x_table.ravel(), z_table.ravel()
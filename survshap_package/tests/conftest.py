@@ -0,0 +1,56 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from sksurv.util import Surv
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "paper", "data")
+
+
+@pytest.fixture(scope="session")
+def dataset():
+    df = pd.read_csv(os.path.join(DATA_DIR, "exp2_dataset0.csv")).iloc[:300]
+    X = df.drop(columns=["time", "event"])
+    y = Surv.from_arrays(df["event"].astype(bool), df["time"])
+    return X, y
+
+
+@pytest.fixture(scope="session")
+def rsf(dataset):
+    from sksurv.ensemble import RandomSurvivalForest
+
+    X, y = dataset
+    return RandomSurvivalForest(n_estimators=10, max_depth=4, min_samples_leaf=10, random_state=0).fit(X, y)
+
+
+@pytest.fixture(scope="session")
+def extra_trees(dataset):
+    from sksurv.ensemble import ExtraSurvivalTrees
+
+    X, y = dataset
+    return ExtraSurvivalTrees(n_estimators=10, max_depth=4, min_samples_leaf=10, random_state=0).fit(X, y)
+
+
+@pytest.fixture(scope="session")
+def coxph(dataset):
+    from sksurv.linear_model import CoxPHSurvivalAnalysis
+
+    X, y = dataset
+    return CoxPHSurvivalAnalysis().fit(X, y)
+
+
+@pytest.fixture(scope="session")
+def coxnet(dataset):
+    from sksurv.linear_model import CoxnetSurvivalAnalysis
+
+    X, y = dataset
+    return CoxnetSurvivalAnalysis(fit_baseline_model=True).fit(X, y)
+
+
+@pytest.fixture
+def reduced_timestamps():
+    def select(explainer, function_type):
+        # every 10th knot keeps the tests fast
+        return np.asarray(explainer.resolve_timestamps(function_type, None))[::10]
+
+    return select
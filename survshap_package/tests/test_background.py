@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+from survshap import SurvivalModelExplainer
+
+
+@pytest.mark.parametrize("method", ["kmeans", "kmedoids", "stratified"])
+def test_summarize_background(rsf, dataset, method):
+    X, y = dataset
+    explainer = SurvivalModelExplainer(rsf, X, y)
+    summarized = explainer.summarize_background(20, method=method, random_state=0)
+
+    assert len(summarized.data) <= 20
+    assert list(summarized.data.columns) == list(X.columns)
+    assert len(summarized.background_weights) == len(summarized.data)
+    assert np.isclose(summarized.background_weights.sum(), 1)
+    assert summarized.y is y
+    error = summarized.background_summary_error
+    assert 0 <= error["mean_abs_error"] <= error["max_abs_error"] < 0.1
+
+    # the summary is reproducible with a fixed random_state
+    again = explainer.summarize_background(20, method=method, random_state=0)
+    assert summarized.data.equals(again.data)
+    assert np.array_equal(summarized.background_weights, again.background_weights)
+
+
+def test_summarize_background_stratified_requires_aligned_y(rsf, dataset):
+    X, y = dataset
+    explainer = SurvivalModelExplainer(rsf, X.iloc[:100], y)
+    with pytest.raises(ValueError, match="every row of data"):
+        explainer.summarize_background(20, method="stratified")
+    # y is not needed by the clustering methods
+    assert len(explainer.summarize_background(20, method="kmeans", random_state=0).data) == 20
+
+
+def test_summarize_background_invalid_method(rsf, dataset):
+    X, y = dataset
+    with pytest.raises(ValueError, match="method should be"):
+        SurvivalModelExplainer(rsf, X, y).summarize_background(20, method="random")
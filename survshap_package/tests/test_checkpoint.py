@@ -0,0 +1,78 @@
+import json
+import pickle
+import numpy as np
+import pytest
+from survshap import ModelSurvSHAP, SurvivalModelExplainer
+from survshap.model_explanations import checkpoint
+
+
+@pytest.fixture
+def explainer(dataset, rsf):
+    X, y = dataset
+    return SurvivalModelExplainer(rsf, X.iloc[:20], y)
+
+
+def fit_with_checkpoints(explainer, new_observations, checkpoint_dir, random_state=0):
+    explanation = ModelSurvSHAP(calculation_method="sampling", B=5, random_state=random_state)
+    explanation.fit(explainer, new_observations, checkpoint_dir=checkpoint_dir, checkpoint_every=2)
+    return explanation
+
+
+def test_resumed_run_matches_uninterrupted_run(monkeypatch, tmp_path, dataset, explainer):
+    X, _ = dataset
+    new_observations = X.iloc[100:107]
+    calculate = checkpoint.calculate_individual_explanations
+    calls = []
+
+    def interrupted(*args, **kwargs):
+        calls.append(len(args[1]))
+        if len(calls) == 3:
+            raise KeyboardInterrupt
+        return calculate(*args, **kwargs)
+
+    monkeypatch.setattr(checkpoint, "calculate_individual_explanations", interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        fit_with_checkpoints(explainer, new_observations, tmp_path)
+    calls.clear()
+    resumed = fit_with_checkpoints(explainer, new_observations, tmp_path)
+    # only the blocks that were not completed are explained again
+    assert calls == [2, 1]
+
+    uninterrupted = ModelSurvSHAP(calculation_method="sampling", B=5, random_state=0)
+    uninterrupted.fit(explainer, new_observations)
+    np.testing.assert_array_equal(resumed.survshap_result.values, uninterrupted.survshap_result.values)
+    np.testing.assert_array_equal(resumed.survshap_result.orders, uninterrupted.survshap_result.orders)
+
+
+def test_checkpoint_keeps_the_seed_drawn_for_random_state_none(tmp_path, dataset, explainer):
+    X, _ = dataset
+    new_observations = X.iloc[100:105]
+    resumed = fit_with_checkpoints(explainer, new_observations, tmp_path, random_state=None)
+    with open(tmp_path / "progress.json") as f:
+        seed = json.load(f)["seed"]
+
+    seeded = ModelSurvSHAP(calculation_method="sampling", B=5, random_state=seed)
+    seeded.fit(explainer, new_observations)
+    np.testing.assert_array_equal(resumed.survshap_result.values, seeded.survshap_result.values)
+
+
+@pytest.mark.parametrize("change", ["model", "background_weights", "predict_survival_function", "observations"])
+def test_checkpoint_of_a_different_explanation_is_rejected(tmp_path, dataset, explainer, extra_trees, change):
+    X, y = dataset
+    new_observations = X.iloc[100:105]
+    fit_with_checkpoints(explainer, new_observations, tmp_path)
+
+    if change == "model":
+        explainer = SurvivalModelExplainer(extra_trees, X.iloc[:20], y)
+    elif change == "background_weights":
+        explainer.background_weights = np.arange(1, 21) / 210
+    elif change == "predict_survival_function":
+        explainer.predict_survival_function = lambda model, data: model.predict_survival_function(data)
+    else:
+        new_observations = X.iloc[100:106]
+    with pytest.raises(ValueError, match="different explanation"):
+        fit_with_checkpoints(explainer, new_observations, tmp_path)
+
+
+def test_fingerprint_of_a_reloaded_model_is_unchanged(rsf):
+    assert checkpoint.hash_object(pickle.loads(pickle.dumps(rsf))) == checkpoint.hash_object(rsf)
@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+from survshap import CoxCoalitionEvaluator, ForestCoalitionEvaluator, PredictSurvSHAP, SurvivalModelExplainer
+from survshap.evaluators import select_coalition_evaluator
+from survshap.predict_explanations.utils import make_predictions_for_simplified_inputs
+
+
+@pytest.mark.parametrize(
+    "model_name, evaluator_name",
+    [
+        ("rsf", "ForestCoalitionEvaluator"),
+        ("extra_trees", "ForestCoalitionEvaluator"),
+        ("coxph", "CoxCoalitionEvaluator"),
+        ("coxnet", "CoxCoalitionEvaluator"),
+    ],
+)
+@pytest.mark.parametrize("function_type", ["sf", "chf"])
+def test_evaluators_match_model_predictions(
+    request, dataset, reduced_timestamps, model_name, evaluator_name, function_type
+):
+    X, y = dataset
+    model = request.getfixturevalue(model_name)
+    fast = SurvivalModelExplainer(model, X.iloc[:30], y)
+    slow = SurvivalModelExplainer(model, X.iloc[:30], y, coalition_evaluator=None)
+    assert type(select_coalition_evaluator(fast, function_type)).__name__ == evaluator_name
+    timestamps = reduced_timestamps(fast, function_type)
+    masks = np.random.default_rng(0).uniform(size=(20, X.shape[1])) < 0.5
+    new_observations = X.iloc[100:103]
+
+    fast_values, slow_values = [
+        make_predictions_for_simplified_inputs(
+            explainer, function_type, explainer.data, masks, new_observations, timestamps
+        )
+        for explainer in [fast, slow]
+    ]
+
+    np.testing.assert_allclose(fast_values, slow_values, rtol=1e-10, atol=1e-10)
+
+
+def test_declared_cox_structure_matches_model(dataset, coxph):
+    X, y = dataset
+    timestamps = coxph.unique_times_[::10]
+    # H(t | x) = H_0(t) exp(x @ coef_)
+    cumulative_hazard = coxph.predict_cumulative_hazard_function(X.iloc[:1])[0]
+    hazard_ratio = np.exp(coxph.predict(X.iloc[:1])[0])
+    evaluator = CoxCoalitionEvaluator(
+        coefficients=coxph.coef_, baseline_cumulative_hazard=lambda t: cumulative_hazard(t) / hazard_ratio
+    )
+    values = []
+    for coalition_evaluator in [evaluator, None]:
+        explainer = SurvivalModelExplainer(coxph, X.iloc[:30], y, coalition_evaluator=coalition_evaluator)
+        explanation = PredictSurvSHAP(function_type="chf")
+        explanation.fit(explainer, X.iloc[[100]], timestamps=timestamps)
+        values.append(explanation.survshap_result.values)
+
+    np.testing.assert_allclose(values[0], values[1], atol=1e-8)
+
+
+def test_unsupported_explicit_evaluator_raises(dataset, coxph):
+    X, y = dataset
+    explainer = SurvivalModelExplainer(coxph, X.iloc[:30], y, coalition_evaluator=ForestCoalitionEvaluator())
+    with pytest.raises(ValueError):
+        PredictSurvSHAP().fit(explainer, X.iloc[[100]])
+
+
+def test_unsupported_cox_evaluator_raises(dataset, rsf):
+    X, y = dataset
+    explainer = SurvivalModelExplainer(rsf, X.iloc[:30], y, coalition_evaluator=CoxCoalitionEvaluator())
+    with pytest.raises(ValueError):
+        PredictSurvSHAP().fit(explainer, X.iloc[[100]])
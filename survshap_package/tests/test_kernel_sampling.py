@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+from survshap import PredictSurvSHAP, SurvivalModelExplainer
+from survshap.predict_explanations.utils import sample_kernel_coalitions
+
+
+@pytest.mark.parametrize("num_variables, num_samples", [(10, 200), (11, 500)])
+def test_sampled_coalitions_are_seeded_paired_and_unique(num_variables, num_samples):
+    masks, weights = sample_kernel_coalitions(num_variables, num_samples, np.random.default_rng(0))
+    same_masks, same_weights = sample_kernel_coalitions(num_variables, num_samples, np.random.default_rng(0))
+    other_masks, _ = sample_kernel_coalitions(num_variables, num_samples, np.random.default_rng(1))
+
+    np.testing.assert_array_equal(masks, same_masks)
+    np.testing.assert_array_equal(weights, same_weights)
+    assert not np.array_equal(masks, other_masks)
+    assert len(masks) <= num_samples
+    # repeated draws are merged into one coalition
+    assert len(np.unique(masks, axis=0)) == len(masks)
+    # coalitions of sizes below p / 2 come with their complements
+    coalitions = {mask.tobytes() for mask in masks}
+    sizes = masks.sum(axis=1)
+    for mask in masks[(sizes > 0) & (sizes < (num_variables - 1) // 2 + 1)]:
+        assert (1 - mask).tobytes() in coalitions
+    assert np.all(weights > 0)
+
+
+def test_approximate_kernel_is_reproducible_and_locally_accurate(dataset, rsf):
+    X, y = dataset
+    explainer = SurvivalModelExplainer(rsf, X.iloc[:30], y)
+    explanations = []
+    for random_state in [0, 0, 1]:
+        explanation = PredictSurvSHAP(max_shap_value_inputs=20, random_state=random_state)
+        explanation.fit(explainer, X.iloc[[100]])
+        explanations.append(explanation)
+
+    np.testing.assert_array_equal(explanations[0].survshap_result.values, explanations[1].survshap_result.values)
+    assert not np.allclose(explanations[0].survshap_result.values, explanations[2].survshap_result.values)
+    for explanation in explanations:
+        np.testing.assert_allclose(
+            explanation.survshap_result.shap_values[0].sum(axis=0),
+            explanation.predicted_function - explanation.baseline_function,
+            atol=1e-6,
+        )
@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+from survshap import ModelSurvSHAP, SurvivalModelExplainer
+
+
+@pytest.mark.parametrize("calculation_method", ["kernel", "sampling"])
+def test_parallel_fit_matches_serial_fit(dataset, rsf, reduced_timestamps, calculation_method):
+    X, y = dataset
+    explainer = SurvivalModelExplainer(rsf, X.iloc[:20], y, coalition_evaluator=None)
+    timestamps = reduced_timestamps(explainer, "sf")
+    results = []
+    for n_jobs in [None, 2]:
+        explanation = ModelSurvSHAP(calculation_method=calculation_method, B=5, random_state=0)
+        explanation.fit(explainer, X.iloc[100:106], timestamps=timestamps, n_jobs=n_jobs)
+        results.append(explanation.survshap_result.values)
+
+    np.testing.assert_allclose(results[0], results[1], atol=1e-12)
+
+
+def test_parallel_approximate_kernel_draws_one_seed(monkeypatch, dataset, rsf, reduced_timestamps):
+    class FixedSeedSequence:
+        def generate_state(self, n_words):
+            return np.array([7], dtype=np.uint32)
+
+    X, y = dataset
+    explainer = SurvivalModelExplainer(rsf, X.iloc[:20], y)
+    timestamps = reduced_timestamps(explainer, "sf")
+    seeded = ModelSurvSHAP(max_shap_value_inputs=20, random_state=7)
+    seeded.fit(explainer, X.iloc[100:106], timestamps=timestamps)
+    # with random_state=None all workers use the coalitions of the seed drawn once before fanning out
+    monkeypatch.setattr(np.random, "SeedSequence", lambda *args: FixedSeedSequence())
+    unseeded = ModelSurvSHAP(max_shap_value_inputs=20)
+    unseeded.fit(explainer, X.iloc[100:106], timestamps=timestamps, n_jobs=2)
+
+    np.testing.assert_allclose(unseeded.survshap_result.values, seeded.survshap_result.values, atol=1e-12)
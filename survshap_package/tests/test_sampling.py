@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+from survshap import PredictSurvSHAP, SurvivalModelExplainer
+
+
+@pytest.mark.parametrize("path_sampling", ["random", "antithetic", "stratified"])
+def test_refine_matches_a_single_fit_with_more_paths(dataset, rsf, reduced_timestamps, path_sampling):
+    X, y = dataset
+    explainer = SurvivalModelExplainer(rsf, X.iloc[:20], y)
+    timestamps = reduced_timestamps(explainer, "sf")
+    refined = PredictSurvSHAP(calculation_method="sampling", B=4, path_sampling=path_sampling, random_state=0)
+    refined.fit(explainer, X.iloc[[100]], timestamps=timestamps)
+    refined.refine(8)
+    single = PredictSurvSHAP(calculation_method="sampling", B=12, path_sampling=path_sampling, random_state=0)
+    single.fit(explainer, X.iloc[[100]], timestamps=timestamps)
+
+    np.testing.assert_allclose(refined.survshap_result.values, single.survshap_result.values, atol=1e-12)
+    np.testing.assert_allclose(
+        refined.standard_errors.iloc[:, 4:].to_numpy(dtype=float),
+        single.standard_errors.iloc[:, 4:].to_numpy(dtype=float),
+        atol=1e-12,
+    )
+
+
+@pytest.mark.parametrize("path_sampling, unit", [("random", 1), ("antithetic", 2), ("stratified", 5)])
+def test_tol_stops_early_after_whole_units(dataset, rsf, reduced_timestamps, path_sampling, unit):
+    X, y = dataset
+    explainer = SurvivalModelExplainer(rsf, X.iloc[:20], y)
+    timestamps = reduced_timestamps(explainer, "sf")
+    explanation = PredictSurvSHAP(
+        calculation_method="sampling", B=200, path_sampling=path_sampling, random_state=0, tol=0.5
+    )
+    explanation.fit(explainer, X.iloc[[100]], timestamps=timestamps)
+
+    n_paths = explanation._sampling_state["n_paths"]
+    assert n_paths < 200
+    assert n_paths % unit == 0
+    assert explanation.standard_errors["aggregated_change"].max() <= 0.5
+
+    # an unreachable tolerance uses all paths
+    explanation.refine(20, tol=0)
+    assert explanation._sampling_state["n_paths"] == n_paths + 20
+
+
+def test_refine_requires_sampling(dataset, rsf):
+    X, y = dataset
+    explanation = PredictSurvSHAP()
+    explanation.fit(SurvivalModelExplainer(rsf, X.iloc[:20], y), X.iloc[[100]])
+    with pytest.raises(ValueError, match="refine is available only"):
+        explanation.refine(10)
@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+from survshap import PredictSurvSHAP, SurvivalModelExplainer, SurvSHAPSession
+
+
+@pytest.mark.parametrize("calculation_method", ["kernel", "sampling", "shap_kernel", "treeshap"])
+def test_session_fits_match_plain_fits(dataset, rsf, calculation_method):
+    X, y = dataset
+    explainer = SurvivalModelExplainer(rsf, X.iloc[:20], y)
+    session = SurvSHAPSession(explainer, "sf", "quantiles").prepare(calculation_method)
+    for i in range(100, 102):
+        with_session = PredictSurvSHAP(calculation_method=calculation_method, B=5, random_state=0)
+        with_session.fit(session, X.iloc[[i]])
+        plain = PredictSurvSHAP(calculation_method=calculation_method, B=5, random_state=0)
+        plain.fit(explainer, X.iloc[[i]], timestamps="quantiles")
+
+        np.testing.assert_allclose(with_session.survshap_result.values, plain.survshap_result.values, atol=1e-12)
+
+
+def test_session_rejects_other_settings(dataset, rsf):
+    X, y = dataset
+    session = SurvSHAPSession(SurvivalModelExplainer(rsf, X.iloc[:20], y), "sf")
+    with pytest.raises(ValueError):
+        PredictSurvSHAP(function_type="chf").fit(session, X.iloc[[100]])
+    with pytest.raises(ValueError):
+        PredictSurvSHAP().fit(session, X.iloc[[100]], timestamps=np.array([1.0, 2.0]))
+
+
+def test_session_backends_are_rebuilt_after_the_explainer_changes(dataset, rsf):
+    X, y = dataset
+    explainer = SurvivalModelExplainer(rsf, X.iloc[:20], y)
+    session = SurvSHAPSession(explainer, "sf").prepare("shap_kernel")
+    kernel_explainer = session.kernel_explainer()
+    explainer.data = X.iloc[:10]
+
+    assert session.kernel_explainer() is not kernel_explainer
+    assert session.kernel_explainer().data.data.shape[0] == 10
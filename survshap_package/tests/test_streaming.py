@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+import pytest
+from survshap import ModelSurvSHAP, SurvivalModelExplainer, SurvSHAPResultStore
+
+
+@pytest.fixture
+def explainer(dataset, rsf):
+    X, y = dataset
+    return SurvivalModelExplainer(rsf, X.iloc[:20], y)
+
+
+@pytest.fixture
+def fitted(dataset, explainer, reduced_timestamps):
+    X, _ = dataset
+    explanation = ModelSurvSHAP()
+    explanation.fit(explainer, X.iloc[100:112], timestamps=reduced_timestamps(explainer, "sf"))
+    return explanation
+
+
+@pytest.mark.parametrize("source_type", ["frame", "csv"])
+def test_fit_stream_matches_fit(tmp_path, dataset, explainer, fitted, source_type):
+    X, _ = dataset
+    source = X.iloc[100:112].reset_index(drop=True)
+    if source_type == "csv":
+        source.to_csv(tmp_path / "observations.csv", index=False)
+        source = tmp_path / "observations.csv"
+    streamed = ModelSurvSHAP()
+    chunks = list(
+        streamed.fit_stream(explainer, source, chunk_size=5, timestamps=fitted.timestamps, sink=tmp_path / "results")
+    )
+
+    assert [len(chunk.values) for chunk in chunks] == [5, 5, 2]
+    pd.testing.assert_frame_equal(streamed.result, fitted.result, check_exact=False, rtol=1e-10)
+    stored = SurvSHAPResultStore(tmp_path / "results").load()
+    np.testing.assert_allclose(stored.values, fitted.survshap_result.values, atol=1e-12)
+    np.testing.assert_array_equal(stored.variable_values, fitted.survshap_result.variable_values)
+
+
+def test_partial_fit_matches_fit(dataset, explainer, fitted):
+    X, _ = dataset
+    incremental = ModelSurvSHAP()
+    for start, stop in [(100, 103), (103, 110), (110, 112)]:
+        # timestamps of the first call are kept by later calls
+        timestamps = fitted.timestamps if start == 100 else "knots"
+        result = incremental.partial_fit(explainer, X.iloc[start:stop], timestamps=timestamps)
+        assert len(result.values) == stop - start
+        np.testing.assert_array_equal(incremental.timestamps, fitted.timestamps)
+
+    assert incremental.statistics.n_observations == 12
+    assert incremental.survshap_result is None
+    pd.testing.assert_frame_equal(incremental.result, fitted.result, check_exact=False, rtol=1e-10)
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+from survshap import SurvivalModelExplainer
+
+
+@pytest.mark.parametrize("function_type", ["sf", "chf"])
+def test_selected_timestamps_approximate_background_predictions(dataset, rsf, function_type):
+    X, y = dataset
+    explainer = SurvivalModelExplainer(rsf, X.iloc[:30], y)
+    full_timestamps = explainer.default_timestamps(function_type)
+
+    knots, knots_error = explainer.select_timestamps(function_type, method="knots", return_error=True)
+    assert knots_error["max_abs_error"] == 0
+    tolerance, tolerance_error = explainer.select_timestamps(function_type, tol=0.05, return_error=True)
+    assert tolerance_error["max_abs_error"] <= 0.05
+    assert len(tolerance) < len(knots) <= len(full_timestamps)
+    quantiles = explainer.select_timestamps(function_type, method="quantiles", n_timestamps=10)
+    assert len(quantiles) <= 10
+    for timestamps in [knots, tolerance, quantiles]:
+        assert np.all(np.isin(timestamps, full_timestamps))
+        assert np.all(np.diff(timestamps) > 0)
+
+
+def test_resolve_timestamps(dataset, rsf):
+    X, y = dataset
+    explainer = SurvivalModelExplainer(rsf, X.iloc[:30], y)
+
+    timestamps, error = explainer.resolve_timestamps("sf", "tolerance", return_error=True)
+    np.testing.assert_array_equal(timestamps, explainer.select_timestamps("sf"))
+    assert error["method"] == "tolerance" and error["n_timestamps"] == len(timestamps)
+    timestamps, error = explainer.resolve_timestamps("sf", [1.0, 2.0], return_error=True)
+    np.testing.assert_array_equal(timestamps, [1.0, 2.0])
+    assert error is None
+    np.testing.assert_array_equal(explainer.resolve_timestamps("sf", None), explainer.default_timestamps("sf"))
+
+
+def test_select_timestamps_errors(dataset, rsf):
+    X, y = dataset
+    explainer = SurvivalModelExplainer(rsf, X.iloc[:30], y)
+    with pytest.raises(ValueError, match="method should be"):
+        explainer.select_timestamps(method="uniform")
+    with pytest.raises(ValueError, match="method should be"):
+        explainer.resolve_timestamps("sf", "uniform")
+
+    censored = y.copy()
+    censored[censored.dtype.names[0]] = False
+    explainer = SurvivalModelExplainer(rsf, X.iloc[:30], censored)
+    with pytest.raises(ValueError, match="at least one event"):
+        explainer.select_timestamps(method="quantiles")
@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+from survshap import ModelSurvSHAP, SurvivalModelExplainer
+from survshap.treeshap import tree_shap_values
+
+
+@pytest.mark.parametrize("model_name", ["rsf", "extra_trees"])
+@pytest.mark.parametrize("function_type", ["sf", "chf"])
+def test_treeshap_matches_exact_kernel(request, dataset, reduced_timestamps, model_name, function_type):
+    X, y = dataset
+    explainer = SurvivalModelExplainer(request.getfixturevalue(model_name), X.iloc[:30], y, coalition_evaluator=None)
+    timestamps = reduced_timestamps(explainer, function_type)
+    new_observations = X.iloc[100:104]
+
+    tree_values = tree_shap_values(explainer, new_observations, function_type, timestamps)
+    kernel = ModelSurvSHAP(function_type=function_type, calculation_method="kernel")
+    kernel.fit(explainer, new_observations, timestamps=timestamps, save_individual_explanations=False)
+
+    np.testing.assert_allclose(tree_values, kernel.survshap_result.shap_values, atol=1e-6)
+
+
+@pytest.mark.parametrize("function_type", ["sf", "chf"])
+def test_treeshap_of_boosting_is_locally_accurate(dataset, reduced_timestamps, function_type):
+    from sksurv.ensemble import GradientBoostingSurvivalAnalysis
+
+    X, y = dataset
+    model = GradientBoostingSurvivalAnalysis(n_estimators=20, max_depth=2, random_state=0).fit(X, y)
+    explainer = SurvivalModelExplainer(model, X.iloc[:30], y)
+    timestamps = reduced_timestamps(explainer, function_type)
+    new_observations = X.iloc[100:104]
+
+    tree_values = tree_shap_values(explainer, new_observations, function_type, timestamps)
+    prediction = explainer.predict_array(new_observations, function_type, timestamps)
+    baseline = explainer.baseline_function(function_type, timestamps)
+
+    np.testing.assert_allclose(tree_values.sum(axis=1), prediction - baseline, atol=1e-8)